@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the read, edit and write paths of sde.
+
+Synthetic JSON and YAML documents are generated for every size asked for,
+each made of records nested ``depth`` levels deep with lists ``width`` items
+wide. Documents made of a single record nested as many levels deep as asked
+for with ``--levels`` time wrapping and serializing deep data, far deeper
+than the recursion limit by default. Every benchmark reports the best time of
+a few repeats, except for the ``memory/`` ones, which report the memory held
+by a wrapped document, and by a plain copy of it to compare with, and the
+``memory/peak/`` ones, the most memory used at once while serializing::
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --save benchmarks/baseline.json
+    python benchmarks/bench.py --compare benchmarks/baseline.json
+
+With ``--compare``, the command exits with 1 when a benchmark got slower, or
+used more memory, than its baseline by more than the threshold, 25% by
+default. Baselines only
+mean something on the machine they were saved on.
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import gc
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sde import backends, read_file  # noqa: E402
+from sde.collection import DottedDict  # noqa: E402
+from sde.sde import write_file  # noqa: E402
+
+DEFAULT_SIZES = (100, 10000)
+DEFAULT_LEVELS = (100, 5000)
+DEFAULT_THRESHOLD = 0.25
+#: Prefix of the benchmarks measuring memory, in bytes, rather than time
+MEMORY = 'memory/'
+#: Prefix of those measuring the peak of the memory used rather than what is held
+PEAK = MEMORY + 'peak/'
+
+
+def make_record(index, depth, width):
+    """Returns a record nested depth levels deep, with width items lists."""
+    record = {'id': index, 'name': 'record {}'.format(index), 'enabled': True,
+              'ratio': index / 7.0, 'tags': ['tag{}'.format(i) for i in range(width)]}
+    if depth > 1:
+        record['child'] = make_record(index, depth - 1, width)
+    return record
+
+
+def make_document(size, depth=4, width=5):
+    """Returns a document holding size records."""
+    return {'name': 'benchmark', 'items': [make_record(i, depth, width) for i in range(size)]}
+
+
+def make_deep_document(levels):
+    """Returns a document whose records hold the next one in a list, levels
+    deep."""
+    document = {'id': levels, 'children': []}
+    for index in range(levels - 1, 0, -1):
+        document = {'id': index, 'children': [document]}
+    return document
+
+
+def deep_key(size, depth):
+    """Returns a key reaching depth levels down in the last record."""
+    return 'items.{}.'.format(size - 1) + 'child.' * (depth - 1) + 'name'
+
+
+def best(func, repeat, min_time=0.1):
+    """Returns the best time of func over repeat runs, each of them calling
+    it enough times to last at least min_time seconds."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time and number < 1000000:
+        number *= 10
+    return min(timer.repeat(repeat, number)) / number
+
+
+def retained(func):
+    """Returns the bytes of memory allocated by func and still held by what
+    it returned, as traced by tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+        del result
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def peak(func):
+    """Returns the most bytes of memory allocated at once while func ran,
+    as traced by tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _dump_json(data):
+    with open(os.devnull, 'w') as fp:
+        data.dump_json(fp)
+
+
+def _with_json_backend(name, func, *args):
+    backends.set_json_backend(name)
+    try:
+        return func(*args)
+    finally:
+        backends.set_json_backend(None)
+
+
+def benchmarks(directory, sizes, depth, width, levels=()):
+    """Yields (name, function) pairs of the benchmarks to run."""
+    for size in sizes:
+        document = make_document(size, depth, width)
+        files = {}
+        for fmt, extension in (('JSON', 'json'), ('YAML', 'yaml')):
+            files[fmt] = os.path.join(directory, '{}.{}'.format(size, extension))
+            write_file(files[fmt], fmt, DottedDict(document, lazy=True))
+
+        for fmt, file in sorted(files.items()):
+            yield 'read_file/{}/{}'.format(fmt.lower(), size), \
+                lambda file=file, fmt=fmt: read_file(file, fmt)
+
+        # every JSON library installed, the fastest being the default
+        with open(files['JSON']) as fp:
+            text = fp.read()
+        for name in backends.available_json_backends():
+            yield 'json_loads/{}/{}'.format(name, size), \
+                lambda name=name: _with_json_backend(name, backends.json_loads, text)
+
+        yield 'wrap/{}'.format(size), lambda: DottedDict(document)
+        yield 'wrap/lazy/{}'.format(size), lambda: DottedDict(document, lazy=True)
+        if tracemalloc is not None:
+            # a wrapped tree holds a copy of the document along with the wrappers
+            yield MEMORY + 'raw/{}'.format(size), lambda: copy.deepcopy(document)
+            yield MEMORY + 'wrap/{}'.format(size), lambda: DottedDict(document)
+
+        data = DottedDict(document, lazy=True)
+        for level in sorted({1, depth}):
+            key = deep_key(size, level)
+            yield 'getitem/depth{}/{}'.format(level, size), lambda key=key: data[key]
+            yield 'setitem/depth{}/{}'.format(level, size), \
+                lambda key=key: data.__setitem__(key, 'value')
+
+        yield 'to_json/{}'.format(size), data.to_json
+        yield 'to_yaml/{}'.format(size), data.to_yaml
+        if tracemalloc is not None:
+            # files are written as the output is encoded, unlike to_json
+            # building it whole
+            yield PEAK + 'dump_json/{}'.format(size), lambda: _dump_json(data)
+            yield PEAK + 'to_json/{}'.format(size), data.to_json
+
+        # every run sets a new value, so that the file is actually written
+        counter = itertools.count()
+        for fmt, file in sorted(files.items()):
+            yield 'cli/{}/{}'.format(fmt.lower(), size), lambda file=file: subprocess.check_call(
+                [sys.executable, '-m', 'sde', 'items.0.name', 'edited{}'.format(next(counter)), file])
+
+    for level in levels:
+        document = make_deep_document(level)
+        yield 'deep/wrap/{}'.format(level), lambda document=document: DottedDict(document)
+        data = DottedDict(document)
+        yield 'deep/to_python/{}'.format(level), data.to_python
+        yield 'deep/to_json/{}'.format(level), data.to_json
+        yield 'deep/to_yaml/{}'.format(level), data.to_yaml
+
+
+def run(sizes, depth, width, repeat, only=None, min_time=0.1, levels=()):
+    """Runs the benchmarks whose names contain only, returning their times
+    in seconds, or memory in bytes, by name."""
+    results = {}
+    directory = tempfile.mkdtemp(prefix='sde-bench-')
+    try:
+        for name, func in benchmarks(directory, sizes, depth, width, levels):
+            if only and only not in name:
+                continue
+            if name.startswith(PEAK):
+                results[name] = peak(func)
+            elif name.startswith(MEMORY):
+                results[name] = retained(func)
+            else:
+                results[name] = best(func, repeat, min_time)
+            print('{:<28} {}'.format(name, _format(name, results[name])), file=sys.stderr)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def _format(name, result):
+    if name.startswith(MEMORY):
+        return '{:>12d}B'.format(result)
+    return '{:>12.6f}s'.format(result)
+
+
+def compare(results, baseline, threshold):
+    """Returns the names of the benchmarks slower, or using more memory,
+    than their baseline by more than threshold, printing how every benchmark
+    compares."""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<28} {} {:>7.2f}x{}'.format(name, _format(name, results[name]), ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of sde.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Numbers of records of the generated documents')
+    parser.add_argument('--depth', type=int, default=4, help='Nesting depth of the records')
+    parser.add_argument('--width', type=int, default=5, help='Number of items of the lists')
+    parser.add_argument('--levels', type=int, nargs='*', default=list(DEFAULT_LEVELS),
+                        help='Nesting levels of the deep documents')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark')
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='Seconds each run of a benchmark lasts at least')
+    parser.add_argument('--only', help='Only run the benchmarks whose names contain this')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results with a baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown over the baseline counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            saved = json.load(fp)
+        # the parameters of the baseline, so that the same documents are timed
+        for option in ('sizes', 'depth', 'width', 'levels'):
+            setattr(args, option, saved['parameters'].get(option, []))
+        if saved['python'] != platform.python_version():
+            print('Baseline taken with Python {}'.format(saved['python']), file=sys.stderr)
+
+    results = run(args.sizes, args.depth, args.width, args.repeat, args.only, args.min_time,
+                  args.levels)
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump({
+                'python': platform.python_version(),
+                'parameters': {'sizes': args.sizes, 'depth': args.depth, 'width': args.width,
+                               'levels': args.levels},
+                'results': results,
+            }, fp, indent=4, sort_keys=True)
+            fp.write('\n')
+    if args.compare:
+        if compare(results, saved['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,15 +7,55 @@ License: BSD, see LICENSE for more details.
 __author__ = "Danila Vershinin"
 
 import logging
+import sys
+from importlib import import_module
 
 from .__about__ import (
     __version__,
 )
 
-from .sde import main
-# We intentionally import for export here, so it is ok to silence DeepSource test
-# skipcq: PY-W2000
-from .sde import edit_file, normalize_val, read_file
+# The public API, by module. Modules are only imported when their names are
+# first used, so that `import sde` or a JSON edit don't pay for PyYAML.
+_EXPORTS = {
+    'main': 'sde',
+    'edit_file': 'sde',
+    'edit_file_many': 'sde',
+    'edit_file_count': 'sde',
+    'edit_files': 'sde',
+    'edit_file_records': 'sde',
+    'append_file': 'sde',
+    'edit_stream': 'sde',
+    'normalize_val': 'sde',
+    'read_file': 'sde',
+    'query_file': 'sdg',
+    'enable_cache': 'cache',
+    'disable_cache': 'cache',
+    'enable_timings': 'timing',
+    'disable_timings': 'timing',
+    'SnapshotDict': 'snapshot',
+}
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        module = _EXPORTS.get(name)
+        if module is None:
+            raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+        value = getattr(import_module('.' + module, __name__), name)
+        globals()[name] = value
+        return value
+else:
+    # We intentionally import for export here, so it is ok to silence DeepSource test
+    # skipcq: PY-W2000
+    from .sde import (main, append_file, edit_file, edit_file_count, edit_file_many, edit_file_records,
+                      edit_files, edit_stream, normalize_val, read_file)
+    # skipcq: PY-W2000
+    from .cache import disable_cache, enable_cache
+    # skipcq: PY-W2000
+    from .timing import disable_timings, enable_timings
+    # skipcq: PY-W2000
+    from .snapshot import SnapshotDict
+    # skipcq: PY-W2000
+    from .sdg import query_file
 
 # https://realpython.com/python-logging-source-code/#library-vs-application-logging-what-is-nullhandler
 # when used as library, we default to opt-in approach, wherein a library user has to enable logging
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Selection of the libraries doing the actual parsing and dumping.
+
+PyYAML comes with bindings to the libyaml C library when it was built against
+it. They are used whenever available, falling back to the pure Python
+implementation otherwise. The choice can be forced for debugging with the
+``SDE_YAML_BACKEND`` environment variable (``c`` or ``python``) or with
+``set_yaml_backend``.
+
+JSON is parsed with orjson when it is installed, and with the standard
+library otherwise. python-rapidjson and ujson can be used too, but are not
+picked automatically, the ``json_loads`` benchmarks not showing them faster
+than the standard library. ``SDE_JSON_BACKEND`` and ``set_json_backend``
+force a backend. Output is always produced by the standard library encoder,
+which streams it: turning the output of the other libraries into what
+``json.dumps(data, indent=4)`` produces costs more than they save.
+
+Libraries are imported on first use, so that nothing is paid at startup for
+a format that is not edited.
+"""
+
+import json
+import os
+from importlib import import_module
+
+YAML_C = 'c'
+YAML_PYTHON = 'python'
+
+_yaml_backend = None
+
+
+def has_libyaml():
+    """Returns True if PyYAML was built with the libyaml bindings."""
+    import yaml
+    return bool(getattr(yaml, '__with_libyaml__', False)
+                and hasattr(yaml, 'CSafeLoader') and hasattr(yaml, 'CDumper'))
+
+
+def set_yaml_backend(name=None):
+    """Forces the YAML backend, ``'c'`` or ``'python'``. None restores the
+    automatic choice."""
+    global _yaml_backend
+    if name not in (None, YAML_C, YAML_PYTHON):
+        raise ValueError('Unknown YAML backend: {}'.format(name))
+    if name == YAML_C and not has_libyaml():
+        raise ValueError('PyYAML was built without libyaml support')
+    _yaml_backend = name
+
+
+def yaml_backend():
+    """Returns the YAML backend in use, ``'c'`` or ``'python'``."""
+    if _yaml_backend is not None:
+        return _yaml_backend
+    forced = os.environ.get('SDE_YAML_BACKEND')
+    if forced == YAML_PYTHON or not has_libyaml():
+        return YAML_PYTHON
+    return YAML_C
+
+
+def yaml_loader():
+    """Returns the safe YAML loader class of the backend in use."""
+    import yaml
+    if yaml_backend() == YAML_C:
+        return yaml.CSafeLoader
+    return yaml.SafeLoader
+
+
+def yaml_load(fp):
+    """Parses the YAML document of a file object with the backend in use."""
+    import yaml
+    return yaml.load(fp, Loader=yaml_loader())
+
+
+#: JSON libraries by order of preference
+JSON_BACKENDS = ('orjson', 'rapidjson', 'ujson', 'json')
+JSON_STDLIB = 'json'
+# those used without being forced, when installed
+_AUTOMATIC_JSON_BACKENDS = ('orjson',)
+
+# JSON libraries imported so far, None for those that are not installed
+_json_modules = {JSON_STDLIB: json}
+
+_json_backend = None
+
+# integers past 64 bits are parsed as floats by orjson, the longest 64-bit
+# ones having 20 digits. Runs of digits are looked for by turning every digit
+# into 0, which is much faster than a regular expression.
+_LONG_DIGITS = u'0' * 20
+_LONG_DIGITS_BYTES = b'0' * 20
+_TO_ZERO = dict((ord(digit), u'0') for digit in u'123456789')
+_TO_ZERO_BYTES = bytes(bytearray(ord('0') if chr(code) in '123456789' else code
+                                 for code in range(256)))
+
+
+def _json_module(name):
+    """Returns the module of a JSON library, or None if it is not installed."""
+    if name not in _json_modules:
+        try:
+            _json_modules[name] = import_module(name)
+        except ImportError:
+            _json_modules[name] = None
+    return _json_modules[name]
+
+
+def available_json_backends():
+    """Returns the names of the JSON libraries installed, by order of
+    preference."""
+    return [name for name in JSON_BACKENDS if _json_module(name) is not None]
+
+
+def set_json_backend(name=None):
+    """Forces the JSON backend, one of JSON_BACKENDS. None restores the
+    automatic choice."""
+    global _json_backend
+    if name is not None and name not in JSON_BACKENDS:
+        raise ValueError('Unknown JSON backend: {}'.format(name))
+    if name is not None and _json_module(name) is None:
+        raise ValueError('JSON backend {} is not installed'.format(name))
+    _json_backend = name
+
+
+def json_backend():
+    """Returns the name of the JSON backend in use."""
+    if _json_backend is not None:
+        return _json_backend
+    forced = os.environ.get('SDE_JSON_BACKEND')
+    if forced in JSON_BACKENDS and _json_module(forced) is not None:
+        return forced
+    for name in _AUTOMATIC_JSON_BACKENDS:
+        if _json_module(name) is not None:
+            return name
+    return JSON_STDLIB
+
+
+def _has_long_digits(text):
+    """Returns True if the text has a run of digits that may be an integer
+    too large for 64 bits."""
+    if isinstance(text, bytes):
+        return text.translate(_TO_ZERO_BYTES).find(_LONG_DIGITS_BYTES) >= 0
+    return text.translate(_TO_ZERO).find(_LONG_DIGITS) >= 0
+
+
+def json_loads(text):
+    """Parses a JSON document. Documents the backend in use rejects, e.g.
+    with NaN, are parsed by the standard library instead, and so are those
+    orjson may have parsed inexactly, with integers too large for 64 bits."""
+    backend = json_backend()
+    if backend != JSON_STDLIB:
+        try:
+            data = _json_modules[backend].loads(text)
+        except (ValueError, TypeError, OverflowError):
+            pass
+        else:
+            if backend != 'orjson' or not _has_long_digits(text):
+                return data
+    return json.loads(text)
+
+
+def json_load(fp):
+    """Parses the JSON document of a file object."""
+    return json_loads(fp.read())
+
+
+def json_dumps(obj, default=None, cls=None):
+    """Returns the same output as ``json.dumps(obj, indent=4, default=default)``,
+    produced by the encoder class cls."""
+    return json.dumps(obj, indent=4, default=default, cls=cls)
+
+
+def json_dump(obj, fp, default=None, cls=None):
+    """Writes the output of json_dumps to a text file object chunk by chunk,
+    as the encoder class cls produces it, without building it as a whole."""
+    for chunk in (cls or json.JSONEncoder)(indent=4, default=default).iterencode(obj):
+        fp.write(chunk)
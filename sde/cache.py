@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+An in-process cache of parsed documents.
+
+Documents are cached by absolute path along with the identity of the file
+they were read from or written to: its inode, modification time and size.
+A file changed by anything else gets a new identity, so its cached document
+is never used again. The cache is bounded both by the number of documents
+and by their approximate size, taken as the size of their files, evicting
+the least recently used documents first.
+
+Cached documents are shared between callers, so they must not be modified:
+edit_file and friends wrap them copy-on-write, but plain ``read_file``
+results are the cached objects themselves.
+"""
+
+import os
+from collections import OrderedDict
+
+
+def file_identity(file):
+    """Returns what identifies the current content of a file, or None if it
+    does not exist."""
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return None
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return stat.st_ino, mtime_ns, stat.st_size
+
+
+class DocumentCache(object):
+    """A bounded LRU cache of parsed documents."""
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        # absolute path -> (format, identity, document)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, file, fmt):
+        """Returns the cached document of the file if the file did not change
+        since, or None."""
+        path = os.path.abspath(file)
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if entry[0] != fmt or entry[1] != file_identity(path):
+            self.discard(path)
+            return None
+        # most recently used entries go last
+        del self._entries[path]
+        self._entries[path] = entry
+        return entry[2]
+
+    def put(self, file, fmt, document, identity=None):
+        """Caches the document parsed from, or just written to, the file.
+        Pass the identity of the file taken before reading it, so that a
+        change made while it was read is not missed."""
+        path = os.path.abspath(file)
+        self.discard(path)
+        if identity is None:
+            identity = file_identity(path)
+        if identity is None or identity[2] > self.max_bytes:
+            return
+        self._entries[path] = (fmt, identity, document)
+        self.size += identity[2]
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.size -= evicted[2]
+
+    def discard(self, file):
+        """Drops the document of the file, if cached."""
+        entry = self._entries.pop(os.path.abspath(file), None)
+        if entry is not None:
+            self.size -= entry[1][2]
+
+    def clear(self):
+        """Drops all documents."""
+        self._entries.clear()
+        self.size = 0
+
+
+_cache = None
+
+
+def enable_cache(max_entries=128, max_bytes=64 * 1024 * 1024):
+    """Starts caching the documents read_file parses and write_file writes,
+    within the given bounds. Returns the cache."""
+    global _cache
+    _cache = DocumentCache(max_entries, max_bytes)
+    return _cache
+
+
+def disable_cache():
+    """Stops caching documents and drops the cached ones."""
+    global _cache
+    _cache = None
+
+
+def document_cache():
+    """Returns the cache in use, or None when caching is disabled."""
+    return _cache
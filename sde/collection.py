@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import copy
 import json
 import re
+import sys
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 
 import six
-import yaml
 from six import add_metaclass, string_types, iteritems
 
+from . import backends
+
 
 # this was only introduced in six 1.13.0, but it's too old in RHEL,
 # and we don't want to rebuild its package
@@ -19,6 +23,16 @@ else:
 
 SPLIT_REGEX = re.compile(r"(?<!\\)(\.)")
 
+#: A path segment matching every key of a dict or every item of a list
+WILDCARD = '*'
+# a path segment matching a range of list items, like a Python slice
+SLICE_REGEX = re.compile(r"^(-?[0-9]*):(-?[0-9]*)$")
+
+
+def is_pattern(part):
+    """Returns True if a path segment is a wildcard or a slice"""
+    return part == WILDCARD or SLICE_REGEX.match(part) is not None
+
 
 def is_dotted_key(key):
     """Returns True if the key has any not-escaped dot inside"""
@@ -59,29 +73,171 @@ def split_key(key, max_keys=0):
     return result
 
 
+class KeyPath(object):
+    r"""A dotted key parsed once into a tuple of its segments.
+
+    Escaped dots are kept inside the segments, the same way ``split_key``
+    does, so ``KeyPath(r'a.b\.c').parts == ('a', r'b\.c')``. ``pattern``
+    tells whether a segment is a wildcard or a slice, see ``set_all``. Use
+    ``KeyPath.parse`` to get instances from a bounded cache, so resolving the
+    same key over and over does not repeat the regex work.
+    """
+
+    __slots__ = ('key', 'parts', 'pattern')
+
+    #: The maximum number of parsed keys kept by ``KeyPath.parse``
+    cache_size = 1024
+    _cache = OrderedDict()
+
+    def __init__(self, key):
+        self.key = key
+        self.parts = tuple(x for x in SPLIT_REGEX.split(key) if x != ".")
+        self.pattern = any(is_pattern(part) for part in self.parts)
+
+    @classmethod
+    def parse(cls, key):
+        """Returns a KeyPath for the key, reusing a cached one when possible.
+        A KeyPath passed in is returned as is."""
+        if isinstance(key, KeyPath):
+            return key
+        cache = cls._cache
+        try:
+            path = cache.pop(key)
+        except KeyError:
+            path = cls(key)
+            try:
+                while len(cache) >= cls.cache_size:
+                    cache.popitem(last=False)
+            except KeyError:
+                pass
+        # (re)inserting marks the key as the most recently used one
+        cache[key] = path
+        return path
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def __eq__(self, other):
+        return isinstance(other, KeyPath) and self.parts == other.parts
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.parts)
+
+    def __repr__(self):
+        return 'KeyPath(%r)' % self.key
+
+    def __str__(self):
+        return self.key
+
+
+# how many levels deeper circular references are looked for again
+_CYCLE_CHECK = 1024
+
+
+def _check_cycle(chain):
+    """Raises ValueError if a node is twice in a chain, a tuple holding a
+    node and the chain of the nodes above it first."""
+    seen = set()
+    while chain is not None:
+        if id(chain[0]) in seen:
+            raise ValueError('Circular reference detected')
+        seen.add(id(chain[0]))
+        chain = chain[1]
+
+
+def walk(root, children):
+    """Walks a tree depth first, in order, with an explicit stack instead of
+    recursion, so that documents of any depth can be walked. Yields every
+    node entered, the root first.
+
+    ``children(node)`` returns an iterator over the nodes right below node,
+    typically a generator: it is advanced to its next node only once the
+    subtree of the previous one was walked, and finishes after all of them
+    were, so it can do its work before, between and after its children.
+    Raises ValueError when a node is below itself.
+    """
+    stack = [children(root)]
+    chain = (root, None)
+    yield root
+    while stack:
+        for node in stack[-1]:
+            chain = (node, chain)
+            # a node below itself makes the path grow forever, so it is
+            # enough to look for one once in a while
+            if not len(stack) % _CYCLE_CHECK:
+                _check_cycle(chain)
+            stack.append(children(node))
+            yield node
+            break
+        else:
+            stack.pop()
+            chain = chain[1]
+
+
+def transform(root, kinds, convert):
+    """Rebuilds a tree from the root down, with an explicit stack instead of
+    recursion, so that documents of any depth can be handled. Cheaper than
+    walk, for when the order nodes are handled in does not matter.
+
+    ``convert(node)`` is called for the root and for every value of one of
+    the types ``kinds`` in the dicts and lists it returns. It returns a
+    ``(result, store)`` pair: result takes the place of the node in its
+    parent, store is the dict or list whose values are converted next, or
+    None. Returns the result for the root. Raises ValueError when a node is
+    below itself.
+    """
+    result, store = convert(root)
+    # (node, entry of the node above, store, depth) entries, their first two
+    # items make the chain of the nodes above
+    stack = [] if store is None else [(root, None, store, 1)]
+    while stack:
+        entry = stack.pop()
+        store, depth = entry[2], entry[3]
+        if not depth % _CYCLE_CHECK:
+            _check_cycle(entry)
+        for key, value in (enumerate(store) if isinstance(store, list) else store.items()):
+            if isinstance(value, kinds):
+                converted, nested = convert(value)
+                if converted is not value:
+                    store[key] = converted
+                if nested is not None:
+                    stack.append((value, entry, nested, depth + 1))
+    return result
+
+
 @add_metaclass(ABCMeta)
 class DottedCollection(object):
     """Abstract Base Class for DottedDict and DottedDict"""
 
+    # wrappers are created for every nested dict or list walked through, so
+    # they carry no per-instance __dict__, only the wrapped container
+    __slots__ = ('store', '_lazy')
+
     @classmethod
-    def factory(cls, initial=None):
+    def factory(cls, initial=None, lazy=False):
         """Returns a DottedDict or a DottedList based on the type of the
         initial value, that must be a dict or a list. In other case the same
         original value will be returned.
         """
         if isinstance(initial, list):
-            return DottedList(initial)
+            return DottedList(initial, lazy=lazy)
         if isinstance(initial, dict):
-            return DottedDict(initial)
+            return DottedDict(initial, lazy=lazy)
         return initial
 
     @classmethod
     def load_json(cls, json_value):
         """Returns a DottedCollection from a JSON string"""
-        return cls.factory(json.loads(json_value))
+        return cls.factory(backends.json_loads(json_value))
 
     @classmethod
-    def _factory_by_index(cls, dotted_key):
+    def _factory_by_index(cls, dotted_key, lazy=False):
         """Returns the proper DottedCollection that best suits the next key in
         the dotted_key string. First guesses the next key and then analyzes it.
         If the next key is numeric then returns a DottedList. In other case a
@@ -89,46 +245,205 @@ class DottedCollection(object):
         """
         if not isinstance(dotted_key, string_types):
             next_key = str(dotted_key)
-        elif not is_dotted_key(dotted_key):
-            next_key = dotted_key
         else:
-            next_key, tmp = split_key(dotted_key, 1)
+            next_key = KeyPath.parse(dotted_key).parts[0]
 
-        return DottedCollection.factory([] if next_key.isdigit() else {})
+        return DottedCollection.factory([] if next_key.isdigit() else {},
+                                        lazy=lazy)
 
-    def __init__(self, initial):
+    def __init__(self, initial, lazy=False):
         """Base constructor. If there are nested dicts or lists they are
         transformed into DottedCollection instances.
+
+        In lazy mode only the keys of this level are validated and nested
+        dicts or lists are left as they are until a path walk reaches them,
+        so building a document costs nothing for the parts that are never
+        accessed.
         """
         if not isinstance(initial, list) and not isinstance(initial, dict):
             raise ValueError('initial value must be a list or a dict')
 
+        self._lazy = lazy
+
+        if lazy:
+            self._validate_keys(initial)
+            self.store = initial
+            return
+
         self._validate_initial(initial)
 
         self.store = initial
 
-        if isinstance(self.store, list):
-            data = enumerate(self.store)
-        else:
-            data = iteritems(self.store)
+        # nested dicts and lists are copied and wrapped level by level, the
+        # whole document being validated already
+        def wrap(node):
+            if node is initial:
+                return self, initial
+            # like factory does, without validating the node again
+            store = list(node) if isinstance(node, list) else dict(node)
+            wrapper = object.__new__(DottedList if isinstance(node, list) else DottedDict)
+            object.__setattr__(wrapper, '_lazy', False)
+            object.__setattr__(wrapper, 'store', store)
+            return wrapper, store
 
-        for key, value in data:
-            try:
-                self.store[key] = DottedCollection.factory(value)
-            except ValueError:
-                pass
+        transform(initial, (dict, list), wrap)
 
-    def _validate_initial(self, initial):
-        """Validates data so no unescaped dotted key is present."""
-        if isinstance(initial, list):
-            for item in initial:
-                self._validate_initial(item)
-        elif isinstance(initial, dict):
-            for key, item in iteritems(initial):
+    @staticmethod
+    def _validate_keys(initial):
+        """Validates that no unescaped dotted key is present at this level."""
+        if isinstance(initial, dict):
+            for key in initial:
                 if is_dotted_key(key):
                     raise ValueError("{0} is not a valid key inside a "
                                      "DottedCollection!".format(key))
-                self._validate_initial(item)
+
+    def _child(self, key):
+        """Returns the value stored under a single (non-dotted) key. In lazy
+        mode a nested dict or list is wrapped on first access and the wrapper
+        replaces it in the store, so later changes go through it.
+        """
+        value = self.store[key]
+        if self._lazy and isinstance(value, (dict, list)):
+            value = DottedCollection.factory(value, lazy=True)
+            self.store[key] = value
+        return value
+
+    def get_path(self, path):
+        """Returns the value at a dotted key or a pre-parsed KeyPath. The path
+        is walked iteratively, one segment per nesting level."""
+        parts = KeyPath.parse(path).parts
+        node = self
+        for i in range(len(parts) - 1):
+            node = node._step(parts, i, 'get')
+        return node._get_one(parts[-1])
+
+    def set_path(self, path, value):
+        """Sets the value at a dotted key or a pre-parsed KeyPath, creating
+        the missing intermediate dicts and lists on the way."""
+        parts = KeyPath.parse(path).parts
+        node = self
+        for i in range(len(parts) - 1):
+            if not node._has_one(parts[i]):
+                node._set_one(parts[i], DottedCollection._factory_by_index(
+                    parts[i + 1], node._lazy))
+            node = node._step(parts, i, 'set')
+        node._set_one(parts[-1], value)
+
+    def delete_path(self, path):
+        """Deletes the value at a dotted key or a pre-parsed KeyPath."""
+        parts = KeyPath.parse(path).parts
+        node = self
+        for i in range(len(parts) - 1):
+            node = node._step(parts, i, 'delete')
+        node._del_one(parts[-1])
+
+    def has_path(self, path):
+        """Returns True if a value exists at a dotted key or a pre-parsed
+        KeyPath."""
+        parts = KeyPath.parse(path).parts
+        node = self
+        for part in parts[:-1]:
+            if not node._has_one(part):
+                return False
+            node = node._get_one(part)
+            if not isinstance(node, DottedCollection):
+                return False
+        return node._has_one(parts[-1])
+
+    def set_all(self, path, value, must_exist=False):
+        """Sets the value at every match of a dotted key whose segments may be
+        wildcards (``users.*.enabled``) or list slices (``users.10:20.enabled``,
+        slices only apply to lists). The matched subtree is walked once, level
+        by level.
+
+        Values matched by a pattern that are not collections are skipped,
+        other segments behave like with set_path. With must_exist, missing
+        keys raise the error of the collection instead of being created.
+        Returns the number of entries whose value changed.
+        """
+        parts = KeyPath.parse(path).parts
+        nodes = [self]
+        for i, part in enumerate(parts[:-1]):
+            matched = []
+            for node in nodes:
+                for key in node._match(part):
+                    if not node._has_one(key):
+                        if must_exist:
+                            raise node._error('{0} is not present'.format(key))
+                        node._set_one(key, DottedCollection._factory_by_index(
+                            parts[i + 1], node._lazy))
+                    if is_pattern(part):
+                        child = node._get_one(key)
+                        if isinstance(child, DottedCollection):
+                            matched.append(child)
+                    else:
+                        matched.append(node._step(parts, i, 'set'))
+            nodes = matched
+
+        changed = 0
+        for node in nodes:
+            for key in node._match(parts[-1]):
+                if node._has_one(key):
+                    current = node._get_one(key)
+                    if current == value and type(current) == type(value):
+                        continue
+                elif must_exist:
+                    raise node._error('{0} is not present'.format(key))
+                # entries must not share a mutable value
+                node._set_one(key, copy.deepcopy(value))
+                changed += 1
+        return changed
+
+    def _step(self, parts, i, action):
+        """Returns the nested collection under parts[i] on the way down the
+        path, or raises the error of this collection type."""
+        target = self._get_one(parts[i])
+        # required by the dotted path
+        if not isinstance(target, DottedCollection):
+            raise self._error('cannot {0} "{1}" in "{2}" ({3})'.format(
+                action,
+                ".".join(parts[i + 1:]),
+                parts[i],
+                repr(target)
+            ))
+        return target
+
+    @staticmethod
+    def _error(message):
+        """Returns the exception raised for a failed path walk."""
+        return KeyError(message)
+
+    @abstractmethod
+    def _get_one(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _set_one(self, key, value):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _del_one(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _has_one(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _match(self, part):
+        """Returns the keys a path segment matches, see set_all."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _validate_initial(initial):
+        """Validates data so no unescaped dotted key is present."""
+
+        def validate(node):
+            DottedCollection._validate_keys(node)
+            return node, node
+
+        if isinstance(initial, (dict, list)):
+            transform(initial, (dict, list), validate)
 
     def __len__(self):
         return len(self.store)
@@ -141,11 +456,27 @@ class DottedCollection(object):
 
     def to_json(self):
         """Returns a JSON representation of the DottedCollection"""
-        return json.dumps(self, cls=DottedJSONEncoder, indent=4)
+        return backends.json_dumps(self.to_python(),
+                                   default=DottedJSONEncoder().default,
+                                   cls=DottedJSONEncoder)
 
     def to_yaml(self):
         """Returns a YAML representation of the DottedCollection"""
-        return yaml.dump(self, Dumper=DottedYAMLDumper)
+        import yaml
+        return yaml.dump(self, Dumper=yaml_dumper())
+
+    def dump_json(self, fp):
+        """Writes the JSON representation of the DottedCollection to a text
+        file object, chunk by chunk"""
+        backends.json_dump(self.to_python(), fp,
+                           default=DottedJSONEncoder().default,
+                           cls=DottedJSONEncoder)
+
+    def dump_yaml(self, fp):
+        """Writes the YAML representation of the DottedCollection to a text
+        file object, as it is emitted"""
+        import yaml
+        yaml.dump(self, fp, Dumper=yaml_dumper())
 
     @abstractmethod
     def __getitem__(self, name):
@@ -159,105 +490,110 @@ class DottedCollection(object):
     def __delitem__(self, name):
         raise NotImplementedError
 
-    @abstractmethod
     def to_python(self):
-        raise NotImplementedError
+        """Returns a plain python dict or list and converts to plain python
+        objects all this object's descendants.
+        """
+
+        def unwrap(wrapper):
+            # the store, as iterating would wrap the items of lazy lists
+            store = wrapper.store
+            store = list(store) if isinstance(store, list) else dict(store)
+            return store, store
+
+        return transform(self, DottedCollection, unwrap)
 
 
 class DottedList(DottedCollection, collections_abc.MutableSequence):
     """A list with support for the dotted path syntax"""
 
-    def __init__(self, initial=None):
+    __slots__ = ()
+
+    def __init__(self, initial=None, lazy=False):
         DottedCollection.__init__(
             self,
-            [] if initial is None else list(initial)
+            [] if initial is None else list(initial),
+            lazy=lazy
         )
 
     def __getitem__(self, index):
         if isinstance(index, slice):
             return self.store[index]
 
-        if isinstance(index, int) \
-                or (isinstance(index, string_types) and index.isdigit()):
-            return self.store[int(index)]
-
-        if isinstance(index, string_types) and is_dotted_key(index):
-            my_index, alt_index = split_key(index, 1)
-            target = self.store[int(my_index)]
+        if isinstance(index, (string_types, KeyPath)):
+            return self.get_path(index)
 
-            # required by the dotted path
-            if not isinstance(target, DottedCollection):
-                raise IndexError('cannot get "{0}" in "{1}" ({2})'.format(
-                    alt_index,
-                    my_index,
-                    repr(target)
-                ))
-
-            return target[alt_index]
+        if isinstance(index, int):
+            return self._child(index)
 
         raise IndexError('cannot get %s in %s' % (index, repr(self.store)))
 
     def __setitem__(self, index, value):
-        if isinstance(index, int) \
-                or (isinstance(index, string_types) and index.isdigit()):
-            # If the index does not exist in the list, but it's the same index
-            # we would obtain by appending the value to the list we actually
-            # append the value. (***)
-            if int(index) not in self.store and int(index) == len(self.store):
-                self.store.append(DottedCollection.factory(value))
-            else:
-                self.store[int(index)] = DottedCollection.factory(value)
-
-        elif isinstance(index, string_types) and is_dotted_key(index):
-            my_index, alt_index = split_key(index, 1)
-
-            # (***)
-            if int(my_index) not in self.store \
-                    and int(my_index) == len(self.store):
-                self.store.append(
-                    DottedCollection._factory_by_index(alt_index))
-
-            if not isinstance(self[int(my_index)], DottedCollection):
-                raise IndexError('cannot set "%s" in "%s" (%s)' % (
-                    alt_index, my_index, repr(self[int(my_index)])))
-
-            self[int(my_index)][alt_index] = DottedCollection.factory(value)
+        if isinstance(index, (string_types, KeyPath)):
+            self.set_path(index, value)
+
+        elif isinstance(index, int):
+            self._set_one(index, value)
 
         else:
             raise IndexError('cannot use %s as index in %s' % (
                 index, repr(self.store)))
 
     def __delitem__(self, index):
-        if isinstance(index, int) \
-                or (isinstance(index, string_types) and index.isdigit()):
-            del self.store[int(index)]
-
-        elif isinstance(index, string_types) and is_dotted_key(index):
-            my_index, alt_index = split_key(index, 1)
-            target = self.store[int(my_index)]
-
-            # required by the dotted path
-            if not isinstance(target, DottedCollection):
-                raise IndexError('cannot delete "%s" in "%s" (%s)' % (
-                    alt_index, my_index, repr(target)))
+        if isinstance(index, (string_types, KeyPath)):
+            self.delete_path(index)
 
-            del target[alt_index]
+        elif isinstance(index, int):
+            del self.store[index]
 
         else:
             raise IndexError('cannot delete %s in %s' % (
                 index, repr(self.store)))
 
-    def to_python(self):
-        """Returns a plain python list and converts to plain python objects all
-        this object's descendants.
-        """
-        result = list(self)
+    def _index(self, key):
+        """Converts a single path segment into a list index."""
+        if isinstance(key, int):
+            return key
+        if isinstance(key, string_types) and key.isdigit():
+            return int(key)
+        raise IndexError('cannot use %s as index in %s' % (
+            key, repr(self.store)))
+
+    def _get_one(self, key):
+        return self._child(self._index(key))
+
+    def _set_one(self, key, value):
+        index = self._index(key)
+        # If the index does not exist in the list, but it's the same index
+        # we would obtain by appending the value to the list we actually
+        # append the value.
+        if index == len(self.store):
+            self.store.append(DottedCollection.factory(value, self._lazy))
+        else:
+            self.store[index] = DottedCollection.factory(value, self._lazy)
 
-        for index, value in enumerate(result):
-            if isinstance(value, DottedCollection):
-                result[index] = value.to_python()
+    def _del_one(self, key):
+        del self.store[self._index(key)]
 
-        return result
+    def _has_one(self, key):
+        try:
+            index = self._index(key)
+        except IndexError:
+            return False
+        return -len(self.store) <= index < len(self.store)
+
+    def _match(self, part):
+        if part == WILDCARD:
+            return range(len(self.store))
+        match = SLICE_REGEX.match(part)
+        if match is None:
+            return [part]
+        bounds = [int(bound) if bound else None for bound in match.groups()]
+        return range(*slice(*bounds).indices(len(self.store)))
+
+    @staticmethod
+    def _error(message):
+        return IndexError(message)
 
     def insert(self, index, value):
         self.store.insert(index, value)
@@ -266,106 +602,100 @@ class DottedList(DottedCollection, collections_abc.MutableSequence):
 class DottedDict(DottedCollection, collections_abc.MutableMapping):
     """A dict with support for the dotted path syntax"""
 
-    def __init__(self, initial=None):
+    __slots__ = ()
+
+    def __init__(self, initial=None, lazy=False):
         DottedCollection.__init__(
             self,
-            {} if initial is None else dict(initial)
+            {} if initial is None else dict(initial),
+            lazy=lazy
         )
 
     def __getitem__(self, k):
-        key = self.__keytransform__(k)
-
-        if not isinstance(k, string_types) or not is_dotted_key(key):
-            return self.store[key]
+        if isinstance(k, KeyPath):
+            return self.get_path(k)
 
-        my_key, alt_key = split_key(key, 1)
-        target = self.store[my_key]
+        key = self.__keytransform__(k)
 
-        # required by the dotted path
-        if not isinstance(target, DottedCollection):
-            raise KeyError('cannot get "{0}" in "{1}" ({2})'.format(
-                alt_key,
-                my_key,
-                repr(target)
-            ))
+        # a plain key is looked up directly, without parsing it
+        if not isinstance(k, string_types) or '.' not in key:
+            return self._child(key)
 
-        return target[alt_key]
+        return self.get_path(key)
 
     def __setitem__(self, k, value):
+        if isinstance(k, KeyPath):
+            return self.set_path(k, value)
+
         key = self.__keytransform__(k)
 
         if not isinstance(k, string_types):
             raise KeyError('DottedDict keys must be str or unicode')
-        if not is_dotted_key(key):
-            self.store[key] = DottedCollection.factory(value)
+        if '.' not in key:
+            self._set_one(key, value)
         else:
-            my_key, alt_key = split_key(key, 1)
-
-            if my_key not in self.store:
-                self.store[my_key] = DottedCollection._factory_by_index(alt_key)
-
-            self.store[my_key][alt_key] = value
+            self.set_path(key, value)
 
     def __delitem__(self, k):
+        if isinstance(k, KeyPath):
+            return self.delete_path(k)
+
         key = self.__keytransform__(k)
 
-        if not isinstance(k, string_types) or not is_dotted_key(key):
+        if not isinstance(k, string_types) or '.' not in key:
             del self.store[key]
-
         else:
-            my_key, alt_key = split_key(key, 1)
-            target = self.store[my_key]
+            self.delete_path(key)
 
-            if not isinstance(target, DottedCollection):
-                raise KeyError('cannot delete "{0}" in "{1}" ({2})'.format(
-                    alt_key,
-                    my_key,
-                    repr(target)
-                ))
+    def _get_one(self, key):
+        return self._child(self.__keytransform__(key))
 
-            del target[alt_key]
+    def _set_one(self, key, value):
+        self.store[self.__keytransform__(key)] = \
+            DottedCollection.factory(value, self._lazy)
 
-    def to_python(self):
-        """Returns a plain python dict and converts to plain python objects all
-        this object's descendants.
-        """
-        result = dict(self)
+    def _del_one(self, key):
+        del self.store[self.__keytransform__(key)]
 
-        for key, value in iteritems(result):
-            if isinstance(value, DottedCollection):
-                result[key] = value.to_python()
+    def _has_one(self, key):
+        return self.__keytransform__(key) in self.store
 
-        return result
+    def _match(self, part):
+        if part == WILDCARD:
+            return list(self.store)
+        return [part]
 
-    __getattr__ = __getitem__
+    def __getattr__(self, k):
+        # special names probed by dir(), copy or pickle are never keys
+        if k[:2] == '__' == k[-2:]:
+            raise AttributeError(k)
+        return self.__getitem__(k)
 
-    # self.store does not exist before __init__() initializes it
+    # other attributes are keys, DottedCollection's slots being the only
+    # real attributes
 
     def __setattr__(self, key, value):
-        if key in self.__dict__ or key == 'store':
+        if key in DottedCollection.__slots__:
             object.__setattr__(self, key, value)
         else:
             self.__setitem__(key, value)
 
     def __delattr__(self, key):
-        if key in self.__dict__ or key == 'store':
+        if key in DottedCollection.__slots__:
             object.__delattr__(self, key)
         else:
             self.__delitem__(key)
 
     def __contains__(self, k):
+        if isinstance(k, KeyPath):
+            return self.has_path(k)
+
         key = self.__keytransform__(k)
 
-        if not isinstance(k, string_types) or not is_dotted_key(key):
+        if not isinstance(k, string_types) or '.' not in key:
             return self.store.__contains__(key)
 
-        my_key, alt_key = split_key(key, 1)
-        target = self.store[my_key]
-
-        if not isinstance(target, DottedCollection):
-            return False
-
-        return alt_key in target
+        return self.has_path(key)
 
     @staticmethod
     def __keytransform__(key):
@@ -378,32 +708,157 @@ class DottedDict(DottedCollection, collections_abc.MutableMapping):
 
 
 class DottedJSONEncoder(json.JSONEncoder):
+    """A JSON encoder for DottedCollection. Its output is the same as the
+    standard library's, but nested dicts and lists are encoded with walk
+    instead of recursion, so documents of any depth can be encoded."""
+
     def default(self, obj):
         """This is called by the encoder for each object."""
         if isinstance(obj, DottedCollection):
             return obj.store
         return json.JSONEncoder.default(self, obj)
 
+    def _floatstr(self, o):
+        if o != o:
+            text = 'NaN'
+        elif o == float('inf'):
+            text = 'Infinity'
+        elif o == float('-inf'):
+            text = '-Infinity'
+        else:
+            return float.__repr__(o)
+        if not self.allow_nan:
+            raise ValueError("Out of range float values are not JSON compliant: " + repr(o))
+        return text
+
+    def _encode_string(self, s):
+        if self.ensure_ascii:
+            return json.encoder.encode_basestring_ascii(s)
+        return json.encoder.encode_basestring(s)
+
+    def _scalar(self, o):
+        """Returns the encoding of a value, or the dict or list to encode in
+        its place, calling default for the values JSON has no type for."""
+        while True:
+            if isinstance(o, string_types):
+                return self._encode_string(o)
+            if o is None:
+                return 'null'
+            if o is True:
+                return 'true'
+            if o is False:
+                return 'false'
+            if isinstance(o, six.integer_types):
+                return int.__repr__(o) if isinstance(o, int) else repr(o)
+            if isinstance(o, float):
+                return self._floatstr(o)
+            if isinstance(o, (list, tuple, dict, DottedCollection)):
+                return o
+            o = self.default(o)
+
+    def _key(self, key):
+        """Returns the encoding of a dict key, or None for skipped ones."""
+        if isinstance(key, string_types):
+            return self._encode_string(key)
+        if isinstance(key, float):
+            key = self._floatstr(key)
+        elif key is True:
+            key = 'true'
+        elif key is False:
+            key = 'false'
+        elif key is None:
+            key = 'null'
+        elif isinstance(key, six.integer_types):
+            key = int.__repr__(key) if isinstance(key, int) else repr(key)
+        elif self.skipkeys:
+            return None
+        else:
+            raise TypeError('keys must be str, int, float, bool or None, '
+                            'not {0}'.format(key.__class__.__name__))
+        return self._encode_string(key)
+
+    def iterencode(self, o, _one_shot=False):
+        """Encodes o, yielding its JSON representation in chunks."""
+        o = self._scalar(o)
+        if isinstance(o, string_types):
+            yield o
+            return
+
+        indent = self.indent
+        if indent is not None and not isinstance(indent, string_types):
+            indent = ' ' * indent
+        item_separator, key_separator = self.item_separator, self.key_separator
+        chunks = []
+        # the indentation of the closing bracket of the container walked
+        levels = ['\n']
+
+        def encode(o):
+            if isinstance(o, DottedCollection):
+                o = o.store
+            is_dict = isinstance(o, dict)
+            if not o:
+                chunks.append('{}' if is_dict else '[]')
+                return
+            chunks.append('{' if is_dict else '[')
+            separator = item_separator
+            if indent is not None:
+                levels.append(levels[-1] + indent)
+                separator += levels[-1]
+                chunks.append(levels[-1])
+            items = o
+            if is_dict:
+                items = sorted(iteritems(o)) if self.sort_keys else iteritems(o)
+            first = True
+            for value in items:
+                if is_dict:
+                    key, value = value
+                    key = self._key(key)
+                    if key is None:
+                        continue
+                if first:
+                    first = False
+                else:
+                    chunks.append(separator)
+                if is_dict:
+                    chunks.append(key)
+                    chunks.append(key_separator)
+                value = self._scalar(value)
+                if isinstance(value, string_types):
+                    chunks.append(value)
+                else:
+                    yield value
+            if indent is not None:
+                levels.pop()
+                chunks.append(levels[-1])
+            chunks.append('}' if is_dict else ']')
+
+        for _ in walk(o, encode):
+            if len(chunks) >= 1024:
+                yield ''.join(chunks)
+                del chunks[:]
+        yield ''.join(chunks)
+
 
 #
-# YAML stuff
+# YAML stuff, see yamldumper
 #
 
+# PyYAML is only imported once YAML is dumped
+_YAML_DUMPER_NAMES = ('DottedYAMLRepresenter', 'DottedYAMLDumper', 'DottedYAMLCDumper')
 
-class DottedYAMLDumper(yaml.Dumper):
-    """
-    We could do,
 
-        dumper.add_representer(DottedDict, lambda dumper, data: data.store)
+def yaml_dumper():
+    """Returns the YAML dumper class for the backend in use."""
+    from .yamldumper import yaml_dumper as dumper
+    return dumper()
 
-    But we'd have to do it for each type.
 
-    This suggests making a custom dumper for a hierarchy of types:
-        https://github.com/yaml/pyyaml/issues/51
-    """
-
-    def represent_data(self, data):
-        """This is called by the representer for each object."""
-        if isinstance(data, DottedCollection):
-            return self.represent_data(data.store)
-        return super(DottedYAMLDumper, self).represent_data(data)
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in _YAML_DUMPER_NAMES:
+            from . import yamldumper
+            return getattr(yamldumper, name)
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+else:
+    from .yamldumper import (DottedYAMLCDumper, DottedYAMLDumper,  # noqa: F401,E402
+                             DottedYAMLRepresenter)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming JSON editing.
+
+Instead of loading the whole document, the input is tokenized in chunks until
+the value at the edited path is found. Only the byte span of that value is
+replaced, everything else is copied through unchanged, so memory use does not
+depend on the file size and the original formatting is kept.
+"""
+
+import json
+import os
+import re
+
+from .collection import DottedCollection, DottedJSONEncoder, KeyPath
+from .streaming import CHUNK_SIZE, Unsupported, copy  # noqa: F401 (re-exported)
+
+_WHITESPACE = re.compile(br'[ \t\n\r]*')
+_STRING = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR = re.compile(br'[^ \t\n\r{}\[\],:"]+')
+_PUNCTUATION = frozenset(b'{}[],:')
+
+OBJECT_START = b'{'
+OBJECT_END = b'}'
+ARRAY_START = b'['
+ARRAY_END = b']'
+COMMA = b','
+COLON = b':'
+STRING = b'"'
+SCALAR = b's'
+
+
+class Token(object):
+    """A JSON token with its absolute byte offsets in the input."""
+
+    __slots__ = ('kind', 'start', 'end', 'raw', 'space')
+
+    def __init__(self, kind, start, end, raw, space):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        # the token text, for strings and scalars only
+        self.raw = raw
+        # the whitespace found right before the token
+        self.space = space
+
+
+class Tokenizer(object):
+    """Reads JSON tokens from a binary stream, one chunk at a time.
+    Only the token being read is kept in memory."""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = b''
+        # absolute offset of self.buf[0]
+        self.base = 0
+        self.pos = 0
+
+    def _fill(self):
+        """Drops the consumed part of the buffer and reads the next chunk.
+        Returns False at the end of the input."""
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.base += self.pos
+        self.pos = 0
+        return True
+
+    def next(self):
+        """Returns the next Token or None at the end of the input."""
+        space = []
+        while True:
+            end = _WHITESPACE.match(self.buf, self.pos).end()
+            space.append(self.buf[self.pos:end])
+            self.pos = end
+            if self.pos < len(self.buf):
+                break
+            if not self._fill():
+                return None
+        space = b''.join(space)
+
+        char = self.buf[self.pos:self.pos + 1]
+        start = self.base + self.pos
+        if char[0] in _PUNCTUATION:
+            self.pos += 1
+            return Token(char, start, start + 1, None, space)
+
+        kind, regex = (STRING, _STRING) if char == STRING else (SCALAR, _SCALAR)
+        while True:
+            match = regex.match(self.buf, self.pos)
+            # a token touching the end of the buffer may continue in the next chunk
+            if match and match.end() < len(self.buf):
+                break
+            if not self._fill():
+                if match:
+                    break
+                raise ValueError('Unterminated JSON string at offset {}'.format(start))
+        raw = match.group()
+        self.pos = match.end()
+        return Token(kind, start, start + len(raw), raw, space)
+
+    def expect(self):
+        """Returns the next Token, failing at the end of the input."""
+        token = self.next()
+        if token is None:
+            raise ValueError('Unexpected end of JSON document')
+        return token
+
+    def skip(self, token):
+        """Skips the value starting with the token and returns its end offset."""
+        if token.kind not in (OBJECT_START, ARRAY_START):
+            return token.end
+        depth = 1
+        while depth:
+            token = self.expect()
+            if token.kind in (OBJECT_START, ARRAY_START):
+                depth += 1
+            elif token.kind in (OBJECT_END, ARRAY_END):
+                depth -= 1
+        return token.end
+
+
+class Span(object):
+    """The location of the value at a path inside a JSON document.
+
+    If the path exists, ``start`` and ``end`` delimit its value. Otherwise
+    ``missing`` holds the segments that have to be created and ``start ==
+    end`` is the offset where the new member or element goes.
+    """
+
+    def __init__(self, start, end, indent=b'', missing=(), prefix=b''):
+        self.start = start
+        self.end = end
+        # the whitespace before the value's member, used to lay out containers
+        self.indent = indent
+        self.missing = tuple(missing)
+        # what goes before an inserted value: separator, whitespace and key
+        self.prefix = prefix
+
+    def read(self, fp):
+        """Returns the raw bytes of the existing value."""
+        fp.seek(self.start)
+        return fp.read(self.end - self.start)
+
+    def value(self, fp):
+        """Returns the existing value, decoded."""
+        return json.loads(self.read(fp).decode('utf-8'))
+
+    def render(self, value):
+        """Returns the bytes replacing the span for the new value."""
+        if self.missing:
+            parts = self.missing[1:]
+            if parts:
+                data = DottedCollection._factory_by_index(parts[0])
+                data.set_path(KeyPath('.'.join(parts)), value)
+                value = data
+        return self.prefix + encode(value, self.indent)
+
+
+def encode(value, indent=b''):
+    """Encodes a value the way DottedCollection.to_json does. Multi-line
+    output is indented to line up with the whitespace it follows."""
+    if b'\n' not in indent:
+        return json.dumps(value, cls=DottedJSONEncoder).encode('utf-8')
+    text = json.dumps(value, cls=DottedJSONEncoder, indent=4).encode('utf-8')
+    return text.replace(b'\n', b'\n' + indent.rsplit(b'\n', 1)[-1])
+
+
+def _decode_key(token):
+    if token.kind != STRING:
+        raise ValueError('Expected a JSON object key at offset {}'.format(token.start))
+    return json.loads(token.raw.decode('utf-8'))
+
+
+def _insert_prefix(first, second, key=None):
+    """Returns what goes before a new member or element added after the
+    existing ones. The whitespace before the second one is reused, or the
+    one before the first one unless it is empty, as on a single line, so the
+    new entry lines up with them."""
+    prefix = b''
+    if second is not None:
+        prefix = COMMA + second.space
+    elif first is not None:
+        prefix = COMMA + (first.space or b' ')
+    if key is not None:
+        prefix += json.dumps(key).encode('utf-8') + b': '
+    return prefix
+
+
+def locate(fp, path, chunk_size=CHUNK_SIZE):
+    """Finds the span of the value at a dotted key or KeyPath in a binary
+    stream holding a JSON document. Raises KeyError or IndexError, like
+    DottedCollection does, if the path runs into a scalar or a list index
+    that can't be created."""
+    parts = KeyPath.parse(path).parts
+    tokens = Tokenizer(fp, chunk_size)
+    token = tokens.expect()
+    indent = b''
+    for i, part in enumerate(parts):
+        if token.kind == OBJECT_START:
+            opened, first, second, last = token, None, None, None
+            token = tokens.expect()
+            while token.kind != OBJECT_END:
+                if last is not None:
+                    if token.kind != COMMA:
+                        raise ValueError('Expected "," at offset {}'.format(token.start))
+                    token = tokens.expect()
+                key = token
+                if first is None:
+                    first = key
+                elif second is None:
+                    second = key
+                if tokens.expect().kind != COLON:
+                    raise ValueError('Expected ":" at offset {}'.format(key.end))
+                value = tokens.expect()
+                if _decode_key(key) == part:
+                    indent = key.space
+                    token = value
+                    break
+                last = tokens.skip(value)
+                token = tokens.expect()
+            else:
+                offset = opened.end if last is None else last
+                return Span(offset, offset, first.space if first else b'', parts[i:],
+                            _insert_prefix(first, second, part))
+        elif token.kind == ARRAY_START:
+            if not part.isdigit():
+                raise IndexError('cannot use {0} as index'.format(part))
+            index, count, opened, first, second, last = int(part), 0, token, None, None, None
+            token = tokens.expect()
+            while token.kind != ARRAY_END:
+                if last is not None:
+                    if token.kind != COMMA:
+                        raise ValueError('Expected "," at offset {}'.format(token.start))
+                    token = tokens.expect()
+                if first is None:
+                    first = token
+                elif second is None:
+                    second = token
+                if count == index:
+                    indent = token.space
+                    break
+                last = tokens.skip(token)
+                count += 1
+                token = tokens.expect()
+            else:
+                if index != count:
+                    raise IndexError('list index out of range')
+                offset = opened.end if last is None else last
+                return Span(offset, offset, first.space if first else b'', parts[i:],
+                            _insert_prefix(first, second))
+        else:
+            raise KeyError('cannot set "{0}" in "{1}"'.format(
+                ".".join(parts[i:]), ".".join(parts[:i])))
+    return Span(token.start, tokens.skip(token), indent)
+
+
+def open_source(file):
+    """Opens a file for locate and splice."""
+    return open(file, 'rb')
+
+
+def open_target(fd):
+    """Opens the file descriptor splice writes to."""
+    return os.fdopen(fd, 'wb')
+
+
+def splice(src, dst, span, data):
+    """Writes the src stream to dst with the span replaced by data."""
+    src.seek(0)
+    copy(src, dst, span.start)
+    dst.write(data)
+    src.seek(span.end)
+    copy(src, dst)
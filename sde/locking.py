@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Coordinating edits of the same file by concurrent processes.
+
+Editors take an advisory lock on ``<file>.lock``, so only one of them reads,
+edits and writes the file at a time and no edit is lost. An editor finding
+the lock taken does not simply wait for its turn: it queues its edits in
+``<file>.queue/`` first. Whoever holds the lock applies every queued edit
+along with its own in a single read and write of the file, and leaves the
+result of each queued request for the process that queued it, which then
+returns without touching the file.
+"""
+
+import errno
+import json
+import os
+import random
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+LOCK_SUFFIX = '.lock'
+QUEUE_SUFFIX = '.queue'
+
+_REQUEST = '.json'
+_RESULT = '.done'
+
+
+class FileLock(object):
+    """An exclusive advisory lock on a file, held through ``<file>.lock``."""
+
+    def __init__(self, file):
+        if fcntl is None:
+            raise ValueError('Locking files is not supported on this platform')
+        self.path = file + LOCK_SUFFIX
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        """Takes the lock, waiting for it unless blocking is False. Returns
+        whether the lock was taken."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except (IOError, OSError) as e:
+            os.close(fd)
+            if not blocking and e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class EditQueue(object):
+    """The edits other processes queued for a file, in ``<file>.queue/``.
+
+    Requests are JSON files named after the time they were queued at, so
+    that they are applied in order, and written atomically. Only the lock
+    holder takes requests and writes their results.
+    """
+
+    def __init__(self, file):
+        self.path = file + QUEUE_SUFFIX
+
+    def _file(self, request_id, suffix):
+        return os.path.join(self.path, request_id + suffix)
+
+    def put(self, edits, must_exist=False):
+        """Queues edits, returning the id of the request. Raises TypeError
+        for values JSON can't hold."""
+        data = json.dumps({'edits': edits, 'must_exist': must_exist})
+        request_id = '{:020d}-{}-{:08x}'.format(int(time.time() * 1e6), os.getpid(),
+                                                random.getrandbits(32))
+        while True:
+            try:
+                os.mkdir(self.path, 0o777)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            tmp = self._file(request_id, '.tmp')
+            try:
+                with open(tmp, 'w') as fp:
+                    fp.write(data)
+                os.rename(tmp, self._file(request_id, _REQUEST))
+                return request_id
+            except (IOError, OSError) as e:
+                # the lock holder removed the empty queue in the meantime
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def pending(self):
+        """Returns the queued requests as (id, edits, must_exist) tuples, in
+        the order they were queued."""
+        try:
+            names = sorted(name for name in os.listdir(self.path) if name.endswith(_REQUEST))
+        except OSError:
+            return []
+        requests = []
+        for name in names:
+            with open(os.path.join(self.path, name)) as fp:
+                request = json.load(fp)
+            edits = [tuple(edit) for edit in request['edits']]
+            requests.append((name[:-len(_REQUEST)], edits, request['must_exist']))
+        return requests
+
+    def complete(self, request_id, result=None, error=None):
+        """Leaves the result of a request for the process that queued it and
+        removes the request."""
+        tmp = self._file(request_id, '.tmp')
+        with open(tmp, 'w') as fp:
+            json.dump({'result': result, 'error': error}, fp)
+        os.rename(tmp, self._file(request_id, _RESULT))
+        os.unlink(self._file(request_id, _REQUEST))
+
+    def take(self, request_id):
+        """Returns and removes the result of a request, a dict holding the
+        result or the error message, or None if it was not applied yet."""
+        path = self._file(request_id, _RESULT)
+        try:
+            with open(path) as fp:
+                done = json.load(fp)
+        except (IOError, OSError):
+            return None
+        os.unlink(path)
+        return done
+
+    def discard(self, request_id):
+        """Removes a request that was not applied."""
+        try:
+            os.unlink(self._file(request_id, _REQUEST))
+        except OSError:
+            pass
+
+    def cleanup(self):
+        """Removes the queue directory if it is empty."""
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
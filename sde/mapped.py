@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Reading values from JSON files without parsing them as a whole.
+
+The file is memory-mapped, so its pages are read on demand and shared with
+every other process reading the same file through the OS cache. A path is
+resolved by scanning the document structurally: keys of the objects on the
+way are decoded, but sibling values are only skipped over, bracket by
+bracket, without being decoded. Only the value at the end of the path is
+parsed, so memory use depends on the size of that value rather than the size
+of the file.
+"""
+
+import json
+import mmap
+import os
+import re
+
+from .backends import json_loads
+from .collection import KeyPath
+from .jsonstream import Span
+from .streaming import Unsupported
+
+_WHITESPACE = re.compile(br'[ \t\n\r]*')
+_STRING = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR = re.compile(br'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null'
+                     br'|NaN|-?Infinity')
+# runs up to the next bracket which is not inside a string
+_BRACKET = re.compile(br'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*([\[\]{}])', re.S)
+_OPENING = (b'{', b'[')
+# the end of a key spelled with escapes, which may be any key
+_ESCAPED_KEY = re.compile(br'\\[^"]*"[ \t\n\r]*:')
+
+
+class MappedJSON(object):
+    """A memory-mapped JSON file values are read from by dotted keys.
+
+    With a ``limit``, scanning past that offset raises Unsupported, to give
+    up on lookups costing more than parsing the file would. So do keys set
+    more than once in an object on the path, json.loads keeping the last of
+    them.
+    """
+
+    def __init__(self, file, limit=None):
+        self.fp = open(file, 'rb')
+        try:
+            # empty files can't be mapped
+            self.buffer = b''
+            if os.fstat(self.fp.fileno()).st_size:
+                self.buffer = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.fp.close()
+            raise
+        self.limit = limit
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _error(self, pos):
+        return ValueError('Invalid JSON at offset {}'.format(pos))
+
+    def _skip_whitespace(self, pos):
+        pos = _WHITESPACE.match(self.buffer, pos).end()
+        if self.limit is not None and pos > self.limit:
+            raise Unsupported('gave up after scanning {} bytes'.format(self.limit))
+        return pos
+
+    def _value_end(self, pos):
+        """Returns the offset right after the value starting at pos."""
+        buffer = self.buffer
+        char = buffer[pos:pos + 1]
+        if char in _OPENING:
+            depth = 0
+            match = _BRACKET.match
+            while True:
+                found = match(buffer, pos)
+                if found is None:
+                    raise self._error(pos)
+                pos = found.end()
+                if found.group(1) in _OPENING:
+                    depth += 1
+                else:
+                    depth -= 1
+                    if not depth:
+                        return pos
+                if self.limit is not None and pos > self.limit:
+                    raise Unsupported('gave up after scanning {} bytes'.format(self.limit))
+        found = (_STRING if char == b'"' else _SCALAR).match(buffer, pos)
+        if found is None:
+            raise self._error(pos)
+        return found.end()
+
+    def _children(self, pos):
+        """Yields the key, or None in arrays, and the offset of every value
+        of the object or array starting at pos."""
+        buffer = self.buffer
+        closing = b'}' if buffer[pos:pos + 1] == b'{' else b']'
+        pos = self._skip_whitespace(pos + 1)
+        if buffer[pos:pos + 1] == closing:
+            return
+        while True:
+            key = None
+            if closing == b'}':
+                found = _STRING.match(buffer, pos)
+                if found is None:
+                    raise self._error(pos)
+                key = json_loads(found.group(0).decode('utf-8'))
+                pos = self._skip_whitespace(found.end())
+                if buffer[pos:pos + 1] != b':':
+                    raise self._error(pos)
+                pos = self._skip_whitespace(pos + 1)
+            yield key, pos
+            pos = self._skip_whitespace(self._value_end(pos))
+            char = buffer[pos:pos + 1]
+            if char == closing:
+                return
+            if char != b',':
+                raise self._error(pos)
+            pos = self._skip_whitespace(pos + 1)
+
+    def span(self, path):
+        """Returns the start and end offsets of the value at a dotted key or
+        KeyPath. Raises KeyError or IndexError, like DottedCollection does,
+        for missing values."""
+        start = self._start(KeyPath.parse(path).parts)
+        return start, self._value_end(start)
+
+    def _start(self, parts):
+        """Returns the offset of the value at the path parts."""
+        pos = self._skip_whitespace(0)
+        error = KeyError
+        for i, part in enumerate(parts):
+            char = self.buffer[pos:pos + 1]
+            if char == b'{':
+                children = self._children(pos)
+                for key, start in children:
+                    if key == part:
+                        pos = start
+                        break
+                else:
+                    raise KeyError(part)
+                if self._may_repeat(part, pos):
+                    for key, _ in children:
+                        if key == part:
+                            raise Unsupported('{0} is set more than once'.format(part))
+                error = KeyError
+            elif char == b'[':
+                if not part.isdigit():
+                    raise IndexError('cannot use %s as index' % part)
+                index = int(part)
+                for count, (_, start) in enumerate(self._children(pos)):
+                    if count == index:
+                        pos = start
+                        break
+                else:
+                    raise IndexError('list index out of range')
+                error = IndexError
+            else:
+                # the error of the collection holding the scalar
+                raise error('cannot get "{0}" in "{1}"'.format(
+                    ".".join(parts[i:]), ".".join(parts[:i])))
+        return pos
+
+    def _may_repeat(self, key, pos):
+        """Tells whether the key may be found again after pos, looking for it
+        as it is spelled without escapes, and for any key spelled with them.
+        Cheaper than scanning the objects it could be in."""
+        raw = json.dumps(key, ensure_ascii=False).encode('utf-8')
+        if b'\\' in raw:
+            return True
+        spelled = re.compile(re.escape(raw) + br'[ \t\n\r]*:')
+        return spelled.search(self.buffer, pos) is not None \
+            or _ESCAPED_KEY.search(self.buffer, pos) is not None
+
+    def append_span(self, parts):
+        """Returns the jsonstream Span inserting a new element after the last
+        one of the array at the path parts, the top-level one if there are
+        none. The end of a top-level array is found from the end of the file,
+        without scanning it. Raises Unsupported if the value is not an
+        array."""
+        buffer = self.buffer
+        start = self._start(parts)
+        if buffer[start:start + 1] != b'[':
+            raise Unsupported('only arrays are appended to')
+        if parts:
+            end = self._value_end(start)
+        else:
+            end = len(buffer)
+            while end and buffer[end - 1:end] in b' \t\n\r':
+                end -= 1
+            if buffer[end - 1:end] != b']':
+                raise self._error(end)
+        # the closing bracket, and the end of the last element
+        last = end - 1
+        while buffer[last - 1:last] in b' \t\n\r':
+            last -= 1
+        if last - 1 == start:
+            return Span(last, last)
+        space = buffer[start + 1:_WHITESPACE.match(buffer, start + 1).end()]
+        return Span(last, last, space, prefix=b',' + (space or b' '))
+
+    def get(self, path):
+        """Returns the value at a dotted key or KeyPath, as plain Python."""
+        start, end = self.span(path)
+        return json_loads(self.buffer[start:end].decode('utf-8'))
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Editing files made of many records: newline-delimited JSON, one document per
+line, and YAML streams of documents separated by ``---``.
+
+Files are split into records without parsing them as a whole. Each record is
+parsed on its own to check the ``where`` conditions, edited in place by the
+streaming editor of its format and written out before the next one is read,
+so memory use does not depend on the file size. Records may also be edited
+in batches by a pool of worker processes.
+"""
+
+import io
+import json
+import re
+from collections import deque
+
+from . import jsonstream, yamlstream
+from .backends import json_loads, yaml_load
+from .collection import DottedCollection, DottedJSONEncoder, KeyPath
+from .streaming import Unsupported, locate_edit
+
+JSON = 'JSON'
+YAML = 'YAML'
+
+#: How many records worker processes are handed at once
+BATCH_SIZE = 1000
+
+_EDITORS = {JSON: jsonstream, YAML: yamlstream}
+
+# document markers and directives only ever start at the first column
+_DOCUMENT_MARKER = re.compile(u'^(---|\\.\\.\\.)(\\s|$)')
+_NOT_CONTENT = re.compile(u'^(\\s*(#.*)?|%.*)$', re.S)
+
+
+def split_json(fp):
+    """Yields the lines of newline-delimited JSON from a binary stream."""
+    for line in fp:
+        yield line
+
+
+def split_yaml(fp):
+    """Yields the text of each document of a YAML stream read from a text
+    stream, starting with its ``---`` marker, comments and directives before
+    it included."""
+    lines, content = [], False
+    for line in fp:
+        marker = _DOCUMENT_MARKER.match(line)
+        if marker and marker.group(1) == u'---' and content:
+            yield u''.join(lines)
+            lines, content = [], False
+        lines.append(line)
+        if marker and marker.group(1) == u'...':
+            yield u''.join(lines)
+            lines, content = [], False
+        elif not content and (marker or not _NOT_CONTENT.match(line)):
+            content = True
+    if lines:
+        yield u''.join(lines)
+
+
+def _load(text, fmt):
+    if fmt == JSON:
+        return json_loads(text) if text.strip() else None
+    return yaml_load(text)
+
+
+def matches(record, where):
+    """Tells whether a parsed record has all the (key, value) pairs of where."""
+    if not where:
+        return True
+    if not isinstance(record, (dict, list)):
+        return False
+    data = DottedCollection.factory(record, lazy=True)
+    for key, value in where:
+        try:
+            current = data.get_path(KeyPath.parse(key))
+        except (KeyError, IndexError):
+            return False
+        if current != value or type(current) != type(value):
+            return False
+    return True
+
+
+def edit_record(text, fmt, edits, where=(), must_exist=False, name='<record>'):
+    """Applies the edits to the text of a record matching where. Returns the
+    new text, or None if the record was left unchanged."""
+    record = _load(text, fmt)
+    if record is None or not matches(record, where):
+        return None
+    editor = _EDITORS[fmt]
+    stream = io.BytesIO if fmt == JSON else io.StringIO
+    changed = False
+    try:
+        for key, value in edits:
+            src = stream(text)
+            located = locate_edit(editor, src, key, value, name, must_exist)
+            if located is not None:
+                dst = stream()
+                editor.splice(src, dst, *located)
+                text, changed = dst.getvalue(), True
+    except Unsupported:
+        return _rewrite(text, record, fmt, edits, must_exist, name)
+    return text if changed else None
+
+
+def _rewrite(text, record, fmt, edits, must_exist, name):
+    """Edits a record the streaming editor can't by loading and dumping it."""
+    from .sde import _apply_edit
+
+    data = DottedCollection.factory(record, lazy=True)
+    changed = False
+    for key, value in edits:
+        if _apply_edit(data, key, value, name, must_exist):
+            changed = True
+    if not changed:
+        return None
+    if fmt == JSON:
+        line = json.dumps(data.to_python(), default=DottedJSONEncoder().default)
+        return line.encode('utf-8') + (b'\n' if text.endswith(b'\n') else b'')
+    marker = u'---\n' if text.startswith(u'---') else u''
+    return marker + data.to_yaml()
+
+
+def _edit_batch(batch, fmt, edits, where, must_exist, name):
+    return [edit_record(text, fmt, edits, where, must_exist, name) for text in batch]
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def edit_records(records, fmt, edits, where=(), must_exist=False, jobs=1,
+                 name='<record>', batch_size=BATCH_SIZE):
+    """Applies the edits to the texts of records, as edit_record does.
+
+    Yields ``(text, edited)`` pairs in order, ``edited`` being None for
+    records left unchanged. With ``jobs`` other than 1, batches of records
+    are edited by that many worker processes (one per CPU with 0), with a
+    bounded number of batches in flight.
+    """
+    args = (fmt, edits, where, must_exist, name)
+    if jobs == 1:
+        for text in records:
+            yield text, edit_record(text, *args)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    jobs = jobs or cpu_count()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for batch in _batches(records, batch_size):
+            pending.append((batch, pool.submit(_edit_batch, batch, *args)))
+            if len(pending) > 2 * jobs:
+                batch, future = pending.popleft()
+                for pair in zip(batch, future.result()):
+                    yield pair
+        while pending:
+            batch, future = pending.popleft()
+            for pair in zip(batch, future.result()):
+                yield pair
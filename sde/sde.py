@@ -1,12 +1,18 @@
 from __future__ import print_function
-import argparse
+import codecs
+import io
 import sys
-import json
-import yaml
 import os.path
+from functools import partial
+from glob import glob
+from importlib import import_module
 
 from .__about__ import __version__
-from .collection import DottedDict
+from .backends import json_load, yaml_load
+from .cache import document_cache, file_identity
+from .collection import DottedCollection, DottedDict, DottedList, KeyPath
+from .streaming import CHUNK_SIZE, Bounded, PipeSource, Unsupported, copy, locate_edit
+from .timing import TimedFile, disable_timings, enable_timings, phase, timings
 
 _JSON = 'JSON'
 _YAML = 'YAML'
@@ -15,63 +21,684 @@ _FORMATS = {
     '.json': _JSON,
     '.yaml': _YAML,
     '.yml': _YAML,
+    '.jsonl': _JSON,
+    '.ndjson': _JSON,
 }
 
+# extensions of files always edited record by record
+_RECORD_EXTENSIONS = ('.jsonl', '.ndjson')
+
+#: The size of the buffer used when writing files
+WRITE_BUFFER_SIZE = 256 * 1024
+
+#: How much of a file is scanned, per edit, to find out that it already holds
+#: the edited values before parsing it as a whole
+PRECHECK_SIZE = 1024 * 1024
+
 if sys.version_info[0] >= 3:
     # Python 3
     unicode = str
 
 
-def edit_file(key, value, file, fmt, must_exist=False):
-    """Edit a file in the specified format."""
-    data = DottedDict(read_file(file, fmt))
+def edit_file(key, value, file, fmt, must_exist=False, stream=False, fsync=False, lock=False):
+    """Edit a file in the specified format.
+
+    With ``stream``, the file is not loaded as a whole: only the edited value
+    is rewritten and the rest of the file is copied through unchanged.
+    """
+    return edit_file_many(file, fmt, [(key, value)], must_exist=must_exist,
+                          stream=stream, fsync=fsync, lock=lock)
+
+
+def edit_file_many(file, fmt, edits, must_exist=False, stream=False, fsync=False, lock=False):
+    """Apply several key/value edits to a file in the specified format.
+
+    The file is read and parsed once, every ``(key, value)`` pair of ``edits``
+    is applied in order against the same data and the file is written at most
+    once. Returns False if no value changed, so the file was left untouched.
+    Keys may hold wildcards and slices, see DottedCollection.set_all.
+
+    With ``stream``, formats supporting it are edited without loading the
+    file, one streaming pass per edit. With ``fsync``, the new content is
+    flushed to disk before it replaces the file. With ``lock``, concurrent
+    edits of the file by other processes are coordinated, see _group_edit.
+    """
+    return edit_file_count(file, fmt, edits, must_exist=must_exist, stream=stream,
+                           fsync=fsync, lock=lock) > 0
+
+
+def edit_file_count(file, fmt, edits, must_exist=False, stream=False, fsync=False, lock=False):
+    """Does what edit_file_many does, returning the number of values changed
+    instead: a key with wildcards or slices counts every match it changed.
+    Returns 0 if the file was left untouched."""
+    if lock:
+        if stream:
+            from .locking import FileLock
+
+            with FileLock(file):
+                return edit_file_count(file, fmt, edits, must_exist, stream, fsync)
+        return _group_edit(file, fmt, edits, must_exist, fsync)
+    if stream and fmt in _STREAM_EDITORS and os.path.exists(file):
+        changed = 0
+        for key, value in edits:
+            changed += _stream_edit(file, fmt, key, value, must_exist, fsync)
+        return changed
+
+    if fmt in _STREAM_EDITORS:
+        with phase('precheck'):
+            if _already_set(file, fmt, edits, must_exist):
+                return 0
+
+    with phase('wrap'):
+        data = DottedDict(read_file(file, fmt), lazy=True)
+    changed = 0
+    with phase('edit'):
+        for key, value in edits:
+            changed += _apply_edit(data, key, value, file, must_exist)
+    if not changed or not write_file(file, fmt, data, fsync=fsync):
+        return 0
+    return changed
+
+
+def _group_edit(file, fmt, edits, must_exist=False, fsync=False):
+    """Edit a file under its lock. If another process holds it, the edits
+    are queued for it to apply along with its own, see sde.locking. Whoever
+    gets the lock applies every queued edit in one read and write."""
+    from .locking import EditQueue, FileLock
+
+    lock, queue = FileLock(file), EditQueue(file)
+    own = None
+    if not lock.acquire(blocking=False):
+        try:
+            own = queue.put(edits, must_exist)
+        except TypeError:
+            # values JSON can't hold are applied by this process only
+            pass
+        lock.acquire()
+    try:
+        if own is not None:
+            done = queue.take(own)
+            if done is not None:
+                queue.cleanup()
+                if done['error'] is not None:
+                    raise ValueError(done['error'])
+                return done['result']
+        requests = queue.pending()
+        if own is None:
+            requests.insert(0, (None, edits, must_exist))
+        results = _apply_requests(file, fmt, requests, fsync)
+        for request_id, _, _ in requests:
+            if request_id != own:
+                result, error = results[request_id]
+                queue.complete(request_id, result, error)
+        if own is not None:
+            queue.discard(own)
+        queue.cleanup()
+        result, error = results[own]
+        if error is not None:
+            raise ValueError(error)
+        return result
+    finally:
+        lock.release()
+
+
+def _apply_requests(file, fmt, requests, fsync=False):
+    """Applies the (id, edits, must_exist) requests to a file in one read
+    and write. A request failing is left out as a whole. Returns a dict of
+    the (number of values changed, error message) of every request by id."""
+    document = read_file(file, fmt)
+    data = DottedDict(document, lazy=True)
+    applied, results = [], {}
+    for request_id, edits, must_exist in requests:
+        try:
+            changed = 0
+            for key, value in edits:
+                changed += _apply_edit(data, key, value, file, must_exist)
+        except (ValueError, LookupError) as e:
+            results[request_id] = 0, e.args[0] if len(e.args) == 1 else str(e)
+            # the lazy wrapper left the document untouched: start over from
+            # it, without the failed request
+            data = DottedDict(document, lazy=True)
+            for key, value, exists in applied:
+                _apply_edit(data, key, value, file, exists)
+            continue
+        applied.extend((key, value, must_exist) for key, value in edits)
+        results[request_id] = changed, None
+    if any(changed for changed, _ in results.values()):
+        write_file(file, fmt, data, fsync=fsync)
+    return results
+
+
+def edit_files(files, edits, jobs=1, **options):
+    """Apply the same edits to many files, each in the format of its extension.
+
+    Files are edited by ``jobs`` worker processes, or by as many as there are
+    CPUs with ``jobs=0``. Yields ``(file, result, error)`` tuples in the order
+    of the files: ``result`` is the number of values changed, as returned by
+    edit_file_count (or of records, by edit_file_records), and ``error`` the
+    message of the error that stopped the edit, if any. Other keyword
+    arguments are passed to edit_file_count, except for
+    ``records`` and ``where``: with ``records``, or for .jsonl and .ndjson
+    files, files are edited with edit_file_records instead, and ``append``:
+    every value is then appended to the list at its key with append_file.
+    """
+    if jobs == 1 or len(files) < 2:
+        # the records of a single file are edited by the workers instead
+        options = dict(options, record_jobs=jobs)
+        for file in files:
+            yield _edit_one(file, edits, options)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+
+    with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+        # hand files out in batches, a single edit is usually quick
+        chunksize = max(1, len(files) // ((jobs or cpu_count()) * 4))
+        for result in pool.map(partial(_edit_one, edits=edits, options=options),
+                               files, chunksize=chunksize):
+            yield result
+
+
+def _edit_one(file, edits, options):
+    """Edit a single file for edit_files, returning errors instead of raising
+    them so they make it back from worker processes."""
+    options = dict(options)
+    records = options.pop('records', False)
+    where = options.pop('where', ())
+    record_jobs = options.pop('record_jobs', 1)
+    append = options.pop('append', False)
+    try:
+        fmt = file_format(file)
+        if append:
+            result = 0
+            for key, value in edits:
+                result += append_file(key, value, file, fmt, fsync=options.get('fsync', False),
+                                      lock=options.get('lock', False))
+        elif records or os.path.splitext(file)[-1].lower() in _RECORD_EXTENSIONS:
+            lock = None
+            if options.get('lock'):
+                from .locking import FileLock
+
+                lock = FileLock(file)
+                lock.acquire()
+            try:
+                result = edit_file_records(file, fmt, edits, where,
+                                           must_exist=options.get('must_exist', False),
+                                           jobs=record_jobs, fsync=options.get('fsync', False))
+            finally:
+                if lock is not None:
+                    lock.release()
+        else:
+            result = edit_file_count(file, fmt, edits, **options)
+        return file, result, None
+    except (ValueError, LookupError, EnvironmentError) as e:
+        return file, None, e.args[0] if len(e.args) == 1 else str(e)
+
+
+def file_format(file):
+    """Returns the format of a file from its extension."""
+    extension = os.path.splitext(file)[-1].lower()
+    fmt = _FORMATS.get(extension)
+    if not fmt:
+        raise ValueError('Unknown extension: ' + extension)
+    return fmt
+
+
+def expand_files(patterns):
+    """Expands glob patterns to the files they match, in order and without
+    duplicates. Names of existing files, e.g. with brackets, are kept as
+    they are rather than taken for patterns, and so are patterns matching
+    nothing, so new files can still be created."""
+    files, seen = [], set()
+    for pattern in patterns:
+        matches = [pattern] if os.path.exists(pattern) else sorted(glob(pattern))
+        for file in matches or [pattern]:
+            if file not in seen:
+                seen.add(file)
+                files.append(file)
+    return files
+
+
+class _Unchanged(Exception):
+    """Raised to drop the new content of a file when nothing changed."""
+
+
+def edit_file_records(file, fmt, edits, where=(), must_exist=False, jobs=1, fsync=False):
+    """Apply edits to every record of a file: each line of newline-delimited
+    JSON, or each document of a YAML stream.
+
+    Only the records having all the ``(key, value)`` pairs of ``where`` are
+    edited. Records are read, edited in place and written one at a time, or
+    by ``jobs`` worker processes in batches (see records.edit_records), so
+    memory use does not depend on the file size. Returns the number of
+    records changed, the file being left untouched when there are none.
+    """
+    from . import records
+
+    editor = _stream_editor(fmt)
+    split = records.split_json if fmt == _JSON else records.split_yaml
+    changed = [0]
+
+    def write(dst):
+        for text, edited in records.edit_records(split(src), fmt, edits, where, must_exist,
+                                                 jobs=jobs, name=file):
+            if edited is None:
+                dst.write(text)
+            else:
+                changed[0] += 1
+                dst.write(edited)
+        if not changed[0]:
+            raise _Unchanged()
+
+    with editor.open_source(file) as src:
+        try:
+            if not _replace_file(file, write, opener=editor.open_target, fsync=fsync):
+                return 0
+        except _Unchanged:
+            pass
+    return changed[0]
+
+
+def _apply_edit(data, key, value, file, must_exist=False):
+    """Set a single key in the data, returning False if it already matched.
+    Keys with wildcards or slices set every match, returning how many
+    changed."""
+    # the key is parsed once and the parsed path reused for both walks
+    path = KeyPath.parse(key)
+    if path.pattern:
+        try:
+            return data.set_all(path, value, must_exist=must_exist)
+        except LookupError:
+            if must_exist:
+                raise ValueError('{} is not present in {}'.format(key, file))
+            raise
     try:
         # This is the way I found it works for array vals too
         # e.g. fruits.0.name
-        if data[key] == value and type(data[key]) == type(value):
+        current = data.get_path(path)
+        if current == value and type(current) == type(value):
             # prevents writing to the file is value is matching already
             return False
-    except KeyError:
+    except (KeyError, IndexError):
+        # a list index right after the last item appends to the list
         if must_exist:
             raise ValueError('{} is not present in {}'.format(key, file))
-    data[key] = value
-    return write_file(file, fmt, data)
+    data.set_path(path, value)
+    return True
+
+
+def append_file(key, value, file, fmt, fsync=False, lock=False):
+    """Append a value to the list at a dotted key, or to the top-level list
+    with an empty key, creating the list if it is missing. A trailing dot,
+    as in ``users.``, is ignored. Returns True.
+
+    The end of the list is found without loading the file: by scanning the
+    memory-mapped document for JSON, and its events for YAML. The new item
+    is then spliced into a copy of the file replacing it, so the rest of the
+    file is copied through without being parsed or serialized. Lists the
+    streaming editors can't append to are edited the usual way. With
+    ``lock``, the file is locked while it is edited, see sde.locking.
+    """
+    if lock:
+        from .locking import FileLock
+
+        with FileLock(file):
+            return append_file(key, value, file, fmt, fsync=fsync)
+    if key.endswith('.'):
+        key = key[:-1]
+    parts = KeyPath.parse(key).parts if key else ()
+    editor = _stream_editor(fmt)
+    try:
+        with phase('locate'):
+            span = _append_span(file, fmt, parts)
+            data = span.render(value)
+    except Exception:
+        # the regular edit reports any error
+        span = None
+    if span is not None:
+        with editor.open_source(file) as src:
+            _replace_file(file, lambda fd: editor.splice(src, fd, span, data),
+                          opener=editor.open_target, fsync=fsync)
+        return True
+
+    with phase('wrap'):
+        document = read_file(file, fmt) if os.path.exists(file) else {} if parts else []
+        data = DottedCollection.factory(document, lazy=True)
+    with phase('edit'):
+        target = data
+        if parts:
+            path = KeyPath.parse(key)
+            if not data.has_path(path):
+                data.set_path(path, [])
+            target = data.get_path(path)
+        if not isinstance(target, DottedList):
+            raise ValueError('{} is not a list in {}'.format(key or 'the document', file))
+        target.append(value)
+    return write_file(file, fmt, data, fsync=fsync)
+
+
+def _append_span(file, fmt, parts):
+    """Returns the span inserting a new item at the end of the list at the
+    path parts of the file."""
+    if fmt == _JSON:
+        from .mapped import MappedJSON
+
+        with MappedJSON(file) as mapped:
+            return mapped.append_span(parts)
+    editor = _stream_editor(fmt)
+    with editor.open_source(file) as src:
+        return editor.locate(src, '.'.join(parts), append=True)
+
+
+# modules of the streaming editors, imported when used
+_STREAM_EDITORS = {
+    _JSON: 'jsonstream',
+    _YAML: 'yamlstream',
+}
+
+
+def _stream_edit(file, fmt, key, value, must_exist=False, fsync=False):
+    """Edit a file by rewriting only the span of the edited value. Edits the
+    streaming editor of the format can't do fall back to a regular edit."""
+    editor = _stream_editor(fmt)
+    with editor.open_source(file) as src:
+        try:
+            with phase('locate'):
+                located = locate_edit(editor, src, key, value, file, must_exist)
+        except Unsupported:
+            return edit_file_count(file, fmt, [(key, value)], must_exist=must_exist,
+                                   fsync=fsync)
+        if located is None:
+            return False
+        span, data = located
+        return _replace_file(file, lambda fd: editor.splice(src, fd, span, data),
+                             opener=editor.open_target, fsync=fsync)
+
+
+def _already_set(file, fmt, edits, must_exist=False):
+    """Tells whether the file already holds the values of all the edits, so
+    that no-op edits are detected without parsing the whole document. YAML
+    files are streamed through, reading at most PRECHECK_SIZE of them per
+    edit, JSON ones are memory-mapped, see _mapped_already_set."""
+    cache = document_cache()
+    if not os.path.exists(file) or cache is not None and cache.get(file, fmt) is not None:
+        return False
+    if fmt == _JSON:
+        return _mapped_already_set(file, edits, must_exist)
+    editor = _stream_editor(fmt)
+    try:
+        with editor.open_source(file) as src:
+            for key, value in edits:
+                src.seek(0)
+                if locate_edit(editor, Bounded(src, PRECHECK_SIZE), key, value, file) is not None:
+                    return False
+    except Exception:
+        # this is only a shortcut, the regular edit reports any error
+        return False
+    return True
+
+
+def _mapped_already_set(file, edits, must_exist=False):
+    """Looks the edited values up in a memory-mapped JSON file, scanning at
+    most a quarter of it, or PRECHECK_SIZE. With must_exist, the key of the
+    first edit missing raises ValueError without parsing the file: the keys
+    of later ones may be created by the edits before them."""
+    from .mapped import MappedJSON
+
+    missing = False
+    try:
+        with MappedJSON(file, max(PRECHECK_SIZE, os.path.getsize(file) // 4)) as mapped:
+            for i, (key, value) in enumerate(edits):
+                if KeyPath.parse(key).pattern:
+                    return False
+                try:
+                    current = mapped.get(key)
+                except KeyError:
+                    missing = i == 0
+                    break
+                if current != value or type(current) != type(value):
+                    return False
+            else:
+                return True
+    except Exception:
+        # this is only a shortcut, the regular edit reports any error
+        return False
+    if missing and must_exist:
+        raise ValueError('{} is not present in {}'.format(edits[0][0], file))
+    return False
+
+
+def _stream_editor(fmt):
+    return import_module('.' + _STREAM_EDITORS[fmt], __package__)
+
+
+def sniff_format(fp):
+    """Tells the format of the document in a buffered binary stream from its
+    first bytes, without consuming them: JSON if it starts with an object or
+    an array, YAML otherwise."""
+    peek = getattr(fp, 'peek', None)
+    if peek is None:
+        raise ValueError('cannot detect the format of an unbuffered stream')
+    head = peek(CHUNK_SIZE).lstrip(b'\xef\xbb\xbf \t\r\n')
+    return _JSON if head[:1] in (b'{', b'[') else _YAML
+
+
+def edit_stream(src, dst, edits, fmt=None, must_exist=False):
+    """Edit the document read from the binary stream src, e.g. stdin, into the
+    binary stream dst, e.g. stdout. The format is sniffed unless given: input
+    sniffed as JSON that does not parse as JSON, like flow style YAML, is
+    edited as YAML.
+
+    A single edit is done by the streaming editor of the format: JSON input
+    is kept in memory up to the edited value only, the rest is copied to dst
+    as it is read, while YAML is parsed to the end first. Other edits load the whole document. Returns False if no
+    value changed, the document being copied through unchanged. Empty input
+    is edited as an empty mapping, and input that does not parse raises
+    ValueError.
+    """
+    import yaml
+    sniffed = fmt is None
+    fmt = fmt or sniff_format(src)
+    error = None
+    if fmt == _JSON:
+        source = PipeSource(src)
+        try:
+            return _edit_stream(source, dst, fmt, edits, must_exist)
+        except ValueError as e:
+            if not sniffed or source.forwarded or _is_json(source):
+                raise
+            error = e
+        # read the input again, what was kept of it first
+        source.seek(0)
+        source.forward()
+        text = codecs.getreader('utf-8')(source)
+    else:
+        text = io.TextIOWrapper(src, encoding='utf-8', newline='')
+    dst = io.TextIOWrapper(dst, encoding='utf-8', newline='')
+    try:
+        return _edit_stream(PipeSource(text), dst, _YAML, edits, must_exist)
+    except yaml.YAMLError as e:
+        # truncated JSON is no valid YAML either, tell why it is no JSON
+        raise error or ValueError(str(e))
+    finally:
+        # leave the underlying streams open
+        dst.flush()
+        dst.detach()
+        if fmt == _YAML:
+            text.detach()
+
+
+def _is_json(source):
+    """Tells whether the input kept by a PipeSource, and the rest of it, is
+    a JSON document, after an edit failed on it."""
+    source.seek(0)
+    try:
+        json_load(source)
+    except ValueError:
+        return False
+    return True
+
+
+def _edit_stream(source, dst, fmt, edits, must_exist):
+    if len(edits) == 1:
+        editor = _stream_editor(fmt)
+        key, value = edits[0]
+        try:
+            located = locate_edit(editor, source, key, value, '<stdin>', must_exist)
+        except Unsupported:
+            pass
+        else:
+            source.seek(0)
+            source.forward()
+            if located is None:
+                copy(source, dst)
+                return False
+            editor.splice(source, dst, located[0], located[1])
+            return True
+
+    source.seek(0)
+    data = {_JSON: json_load, _YAML: yaml_load}[fmt](source)
+    data = DottedCollection.factory({} if data is None else data, lazy=True)
+    changed = False
+    for key, value in edits:
+        if _apply_edit(data, key, value, '<stdin>', must_exist):
+            changed = True
+    source.seek(0)
+    source.forward()
+    if not changed:
+        copy(source, dst)
+        return False
+    if fmt == _JSON:
+        dst = io.TextIOWrapper(dst, encoding='utf-8', newline='')
+        data.dump_json(dst)
+        dst.flush()
+        dst.detach()
+    else:
+        data.dump_yaml(dst)
+    return True
 
 
 def read_file(file, fmt):
+    """Read and parse a file in the specified format, or get it from the
+    document cache when enabled. Missing files read as empty documents."""
+    cache = document_cache()
+    if cache is not None:
+        data = cache.get(file, fmt)
+        if data is not None:
+            return data
+        identity = file_identity(file)
     load = {
-        _JSON: json.load,
-        _YAML: yaml.safe_load,
+        _JSON: json_load,
+        _YAML: yaml_load,
     }[fmt]
     try:
-        with open(file) as fd:  # skipcq: PTC-W6004
+        with phase('read'), open(file) as fd:  # skipcq: PTC-W6004
             data = load(fd)
     except IOError:
-        data = {}
+        return {}
 
+    if cache is not None:
+        cache.put(file, fmt, data, identity)
     return data
 
 
-def write_file(file, fmt, data):
-    """Write data to file in the specified format."""
-    to = {
-        _JSON: data.to_json,
-        _YAML: data.to_yaml,
+def write_file(file, fmt, data, fsync=False):
+    """Write data to file in the specified format.
+
+    The data is serialized straight into the temporary file replacing the
+    file, without building the whole output in memory first.
+    """
+    dump = {
+        _JSON: data.dump_json,
+        _YAML: data.dump_yaml,
     }[fmt]
-    tmp = file + ".tmp"
-    with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL), "w") as fd:
+    result = _replace_file(file, dump, fsync=fsync)
+    cache = document_cache()
+    if cache is not None:
+        cache.put(file, fmt, data.to_python())
+    return result
+
+
+def _replace_file(file, write, opener=None, fsync=False):
+    """Atomically replace the file with what ``write`` writes into the file
+    object it is called with. ``opener`` turns the temporary file descriptor
+    into that file object, a buffered text mode file by default. With
+    ``fsync``, the data is flushed to disk before the rename.
+
+    If what was written is the current content of the file, the file is left
+    alone, keeping its modification time, and False is returned.
+
+    The temporary file is named uniquely next to the file, so that concurrent
+    edits never share it, and gets the permissions new files get."""
+    import tempfile
+
+    directory, name = os.path.split(file)
+    handle, tmp = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or os.curdir)
+    try:
+        os.chmod(tmp, 0o666 & ~_umask())
+    except Exception:
+        os.close(handle)
+        os.unlink(tmp)
+        raise
+    if opener is None:
+        opener = partial(os.fdopen, mode="w", buffering=WRITE_BUFFER_SIZE)
+    if timings() is not None:
+        opener = _timed(opener)
+    with opener(handle) as fd:
         try:
-            fd.write(to())
+            with phase('serialize'):
+                write(fd)
+            with phase('write'):
+                fd.flush()
+            with phase('compare'):
+                same = _same_content(tmp, file)
+            if same:
+                fd.close()
+                os.unlink(tmp)
+                return False
+            if fsync:
+                with phase('fsync'):
+                    os.fsync(fd.fileno())
             fd.close()
-            os.rename(tmp, file)
+            with phase('rename'):
+                os.rename(tmp, file)
             return True
         except Exception:
-            # We can assume we can remove it, because we successfully created
-            # it with O_EXCL above.
+            # mkstemp created it for this edit only, it is ours to remove
             os.unlink(tmp)
             raise
 
 
+def _umask():
+    """Returns the umask of the process, which can only be read by setting
+    it."""
+    umask = os.umask(0o22)
+    os.umask(umask)
+    return umask
+
+
+def _timed(opener):
+    """Makes an opener of _replace_file record writes as the write phase."""
+    return lambda fd: TimedFile(opener(fd))
+
+
+def _same_content(new, old):
+    """Compares the bytes of two files, which is only done when their sizes
+    match, so a changed file rarely costs more than a stat call."""
+    try:
+        if os.path.getsize(new) != os.path.getsize(old):
+            return False
+        with open(new, 'rb') as a, open(old, 'rb') as b:
+            while True:
+                chunk = a.read(CHUNK_SIZE)
+                if chunk != b.read(CHUNK_SIZE):
+                    return False
+                if not chunk:
+                    return True
+    except (IOError, OSError):
+        return False
+
+
 def normalize_val(val):
     """Normalize JSON value to a proper type.
     https://google.github.io/styleguide/jsoncstyleguide.xml#Double_Quotes"""
@@ -97,42 +724,221 @@ def normalize_val(val):
     return val
 
 
-def main():
-    """The entrypoint to CLI app."""
+def normalize_json_val(val):
+    """Normalize a value that may be written as JSON, e.g. an object or a list
+    to append, falling back to normalize_val when it is not valid JSON."""
+    import json
+
+    try:
+        return json.loads(val)
+    except ValueError:
+        return normalize_val(val)
+
+
+def _pipe(edits, args):
+    """Edit the document from stdin to stdout for the CLI."""
+    sys.stdout.flush()
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    try:
+        res = edit_stream(getattr(sys.stdin, 'buffer', sys.stdin), stdout, edits,
+                          must_exist=args.must_exist)
+    except (ValueError, LookupError) as e:
+        print("\033[91mError: \033[0m" + (e.args[0] if len(e.args) == 1 else str(e)),
+              file=sys.stderr)
+        sys.exit(1)
+    finally:
+        stdout.flush()
+    if args.must_change and res is False:
+        sys.exit(2)
+
+
+def parse_edit(edit, is_string=False, normalize=normalize_val):
+    """Parse a ``key=val`` assignment into a ``(key, value)`` pair."""
+    key, sep, val = edit.partition('=')
+    if not sep or not key:
+        raise ValueError('Invalid edit, expected <key>=<val>: ' + edit)
+    if not is_string:
+        val = normalize(val)
+    return key, val
+
+
+def read_edits(file, is_string=False, normalize=normalize_val):
+    """Read ``key=val`` assignments, one per line, from a file.
+    Empty lines and lines starting with ``#`` are skipped."""
+    if file == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(file) as fd:
+            lines = fd.readlines()
+    edits = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        edits.append(parse_edit(line, is_string, normalize))
+    return edits
+
+
+def main(argv=None):
+    """The entrypoint to CLI app.
+
+    With ``SDE_SOCKET`` set, the command line is run by the sde server
+    listening on that socket, if any.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    address = os.environ.get('SDE_SOCKET')
+    if address and '--server' not in argv:
+        from . import server
+        status = server.request(address, argv)
+        if status is not None:
+            sys.exit(status)
+    run_cli(argv)
+
+
+def run_cli(argv):
+    """Runs a command line in this process."""
+    import argparse
     epilog = None
     parser = argparse.ArgumentParser(description='Simple data editor.',
                                      epilog=epilog,
-                                     prog='sde')
-    parser.add_argument('key', metavar='<key>', help='Key to edit')
-    parser.add_argument('val', metavar='<val>', help='New value')
-    parser.add_argument('file', metavar='<filename>', help='Filename to edit')
+                                     prog='sde',
+                                     usage='%(prog)s [options] <key> <val> <filename> [<filename> ...]\n'
+                                           '       %(prog)s [options] -k <key>=<val> [-k ...] '
+                                           '<filename> [<filename> ...]')
+    parser.add_argument('args', metavar='<key> <val> <filename>', nargs='*',
+                        help='Key to edit, new value and filenames or glob patterns of the '
+                             'files to edit. Only the filenames are passed when edits are '
+                             'given with -k or --edits-from')
+    parser.add_argument('-k', '--key', dest='edits', action='append', metavar='<key>=<val>',
+                        help='Assignment to apply, may be repeated to edit many keys at once')
+    parser.add_argument('--edits-from', dest='edits_from', metavar='<file>',
+                        help='Read <key>=<val> assignments, one per line, from a file ("-" for stdin)')
     parser.add_argument('-e', '--must-exist', dest='must_exist', action='store_true',
                         help='Throw error and exit if the key does not already exist')
     parser.add_argument('-m', '--must-change', dest='must_change', action='store_true',
                         help='Exit with status code 2 if the values already match and file unchanged')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
+                        help='Print whether the file was changed, and how many values changed, '
+                             'as is done for each file when there are several')
     parser.add_argument('-s', '--string', dest='is_string', action='store_true',
                         help='Always treat value as a string by quoting it')
+    parser.add_argument('--stream', dest='stream', action='store_true',
+                        help='Rewrite only the edited value without loading the whole file, '
+                             'keeping the rest of it, comments included, unchanged')
+    parser.add_argument('--records', dest='records', action='store_true',
+                        help='Edit every record of the files: each line of newline-delimited JSON, '
+                             'or each document of multi-document YAML (implied for .jsonl and .ndjson)')
+    parser.add_argument('--where', dest='where', action='append', metavar='<key>=<val>',
+                        help='Only edit the records where the key has this value, may be repeated')
+    parser.add_argument('-a', '--append', dest='append', action='store_true',
+                        help='Append the value to the list at the key instead of setting it, '
+                             'an empty key being the top-level list. Values are parsed as JSON '
+                             'when they are valid JSON, e.g. objects')
+    parser.add_argument('--lock', dest='lock', action='store_true',
+                        help='Coordinate with other sde processes editing the same files with --lock: '
+                             'edits made while another one holds a file are applied by it, in one write')
+    parser.add_argument('--fsync', dest='fsync', action='store_true',
+                        help='Flush the new content to disk before it replaces the file')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, metavar='N',
+                        help='Edit files with N worker processes, 0 for one per CPU')
+    parser.add_argument('--timings', dest='timings', action='store_true',
+                        help='Print the time and peak memory spent in each phase of the edits to stderr')
+    parser.add_argument('--timings-format', dest='timings_format', choices=('text', 'json'),
+                        help='Print the timings as text (the default) or as JSON')
+    parser.add_argument('--profile', dest='profile', metavar='<file>',
+                        help='Profile the edits with cProfile and save the stats to <file>')
+    parser.add_argument('--server', dest='server', nargs='?', const='', metavar='<socket>',
+                        help='Serve edits on a Unix domain socket, see SDE_SOCKET')
     parser.add_argument('--version', action='version',
                         version='%(prog)s {version}'.format(version=__version__))
-    parser.set_defaults(is_string=False, must_exist=False, must_change=False)
-    args = parser.parse_args()
+    parser.set_defaults(is_string=False, must_exist=False, must_change=False, verbose=False, stream=False,
+                        fsync=False, jobs=1, records=False, append=False, lock=False, timings=False,
+                        timings_format='text')
+    # options may come between the key, the value and the filenames, as
+    # with a single positional per argument; Python 2 has no intermixed
+    # parsing, and needs options first
+    parse = getattr(parser, 'parse_intermixed_args', parser.parse_args)
+    args = parse(argv)
 
-    if args.is_string:
-        val = args.val
-    else:
-        val = normalize_val(args.val)
+    if args.server is not None:
+        from . import server
+        try:
+            server.serve(args.server or None)
+        except (ValueError, EnvironmentError) as e:
+            print("\033[91mError: \033[0m" + str(e), file=sys.stderr)
+            sys.exit(1)
+        return
 
-    extension = os.path.splitext(args.file)[-1].lower()
+    recorded = enable_timings() if args.timings else None
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        _edit_cli(parser, args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if recorded is not None:
+            disable_timings()
+            print(recorded.format(args.timings_format), file=sys.stderr)
 
-    fmt = _FORMATS.get(extension)
-    if not fmt:
-        print("\033[91mError: \033[0mUnknown extension: " + extension, file=sys.stderr)
-        sys.exit(1)
 
+def _edit_cli(parser, args):
+    """Runs the edits of a parsed command line."""
+    batch = args.edits is not None or args.edits_from is not None
+    if batch and not args.args:
+        parser.error('expected <filename>')
+    if not batch and len(args.args) < 3:
+        parser.error('expected <key> <val> <filename>')
+    if args.jobs < 0:
+        parser.error('the number of jobs cannot be negative')
+    if args.append and (args.records or args.where or args.stream):
+        parser.error('--append can\'t be used with --records, --where or --stream')
+
+    # appended values may be whole objects or lists, e.g. records
+    normalize = normalize_json_val if args.append else normalize_val
     try:
-        res = edit_file(args.key, val, args.file, fmt, must_exist=args.must_exist)
-        if args.must_change and res is False:
-            sys.exit(2)
-    except ValueError as e:
+        if batch:
+            edits = [parse_edit(edit, args.is_string, normalize) for edit in args.edits or []]
+            if args.edits_from:
+                edits.extend(read_edits(args.edits_from, args.is_string, normalize))
+        else:
+            key, val = args.args[:2]
+            edits = [(key, val if args.is_string else normalize(val))]
+        where = [parse_edit(condition) for condition in args.where or []]
+    except (ValueError, IOError) as e:
         print("\033[91mError: \033[0m" + str(e), file=sys.stderr)
         sys.exit(1)
+    files = expand_files(args.args if batch else args.args[2:])
+
+    if '-' in files:
+        if len(files) > 1 or args.edits_from == '-':
+            parser.error('"-" reads the document from stdin, it can\'t be used with other inputs')
+        if args.append:
+            parser.error('--append can\'t be used with "-"')
+        _pipe(edits, args)
+        return
+
+    failed = unchanged = False
+    results = edit_files(files, edits, jobs=args.jobs, must_exist=args.must_exist,
+                         stream=args.stream, fsync=args.fsync,
+                         records=args.records or bool(where), where=where, append=args.append,
+                         lock=args.lock)
+    for file, res, error in results:
+        # with several files, tell which ones were changed or failed
+        name = file + ": " if len(files) > 1 else ""
+        if error is not None:
+            failed = True
+            print("\033[91mError: \033[0m" + name + error, file=sys.stderr)
+            continue
+        unchanged = unchanged or not res
+        # tell how many values (or records) changed
+        if name or args.verbose:
+            print(name + ("changed ({})".format(res) if res else "unchanged"))
+    if failed:
+        sys.exit(1)
+    if args.must_change and unchanged:
+        sys.exit(2)
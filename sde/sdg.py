@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Reading values from JSON and YAML files, the ``sdg`` command.
+
+Keys are resolved like ``DottedCollection.__getitem__`` does. With an index,
+the document is flattened into an SQLite database next to the file
+(``<file>.sdg-index``) mapping every path to its value. Later lookups read
+only the paths asked for from it instead of parsing the document again, until
+the inode, modification time or size of the file change.
+"""
+from __future__ import print_function
+
+import json
+import numbers
+import os
+import sys
+import tempfile
+
+from six import string_types, text_type
+
+from .__about__ import __version__
+from .cache import file_identity
+
+#: Appended to the name of a file to name its index
+INDEX_SUFFIX = '.sdg-index'
+# bumped whenever the layout of the index changes
+INDEX_VERSION = 1
+
+# joins path parts in the index, it sorts before any printable character
+_SEPARATOR = u'\x1f'
+_DICT, _LIST, _VALUE = u'd', u'l', u'v'
+
+
+def _plain(value):
+    """Turns a value read from a DottedCollection into plain Python."""
+    to_python = getattr(value, 'to_python', None)
+    return to_python() if to_python else value
+
+
+def _flatten(document):
+    """Yields (path, kind, value) rows for every node below the document.
+    Raises ValueError for keys that are not strings, e.g. YAML integers,
+    which paths can't be told apart from the string ones."""
+    stack = [((), document)]
+    while stack:
+        parts, node = stack.pop()
+        if isinstance(node, dict):
+            children = node.items()
+            if not all(isinstance(key, string_types) for key in node):
+                raise ValueError('cannot index keys that are not strings')
+        else:
+            children = ((str(index), child) for index, child in enumerate(node))
+        for key, child in children:
+            path = parts + (key,)
+            if isinstance(child, (dict, list)):
+                yield _SEPARATOR.join(path), _DICT if isinstance(child, dict) else _LIST, None
+                stack.append((path, child))
+            else:
+                yield _SEPARATOR.join(path), _VALUE, json.dumps(child, default=str)
+
+
+class PathIndex(object):
+    """The persisted index of a file, see the module's documentation."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @staticmethod
+    def path(file):
+        return file + INDEX_SUFFIX
+
+    @classmethod
+    def open(cls, file):
+        """Returns the index of the file, or None if it is missing or does not
+        match the current content of the file."""
+        try:
+            import sqlite3
+        except ImportError:
+            return None
+        path = cls.path(file)
+        if not os.path.exists(path):
+            return None
+        try:
+            connection = sqlite3.connect(path)
+            meta = dict(connection.execute('SELECT key, value FROM meta'))
+        except sqlite3.Error:
+            return None
+        identity = file_identity(file)
+        if meta.get('version') != str(INDEX_VERSION) \
+                or identity is None or meta.get('identity') != json.dumps(identity):
+            connection.close()
+            return None
+        return cls(connection)
+
+    @classmethod
+    def build(cls, file, document, identity):
+        """Writes the index of the document read from the file, whose identity
+        was taken before reading it. Returns False if it could not be written,
+        an index being only an optimization. Documents with keys that are
+        not strings are not indexed."""
+        try:
+            import sqlite3
+        except ImportError:
+            return False
+        if not isinstance(document, (dict, list)):
+            return False
+        directory = os.path.dirname(os.path.abspath(file))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.sdg-')
+        except OSError:
+            return False
+        os.close(fd)
+        try:
+            connection = sqlite3.connect(tmp)
+            try:
+                with connection:
+                    connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+                    connection.execute('CREATE TABLE paths (path TEXT PRIMARY KEY, kind TEXT, value TEXT)')
+                    connection.executemany('INSERT INTO meta VALUES (?, ?)', [
+                        ('version', str(INDEX_VERSION)),
+                        ('identity', json.dumps(identity)),
+                    ])
+                    connection.executemany('INSERT INTO paths VALUES (?, ?, ?)', _flatten(document))
+            finally:
+                connection.close()
+            os.rename(tmp, cls.path(file))
+        except (sqlite3.Error, OSError, ValueError):
+            return False
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        return True
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, key):
+        """Returns the value at a dotted key, as plain Python. Raises KeyError
+        if there is none."""
+        from .collection import KeyPath
+
+        path = _SEPARATOR.join(KeyPath.parse(key).parts)
+        row = self.connection.execute(
+            'SELECT kind, value FROM paths WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            raise KeyError('{} is not present'.format(key))
+        kind, value = row
+        if kind == _VALUE:
+            return json.loads(value)
+        return self._subtree(path, kind)
+
+    def _subtree(self, path, kind):
+        """Rebuilds the collection at a path from the rows below it."""
+        prefix = path + _SEPARATOR
+        rows = self.connection.execute(
+            'SELECT path, kind, value FROM paths WHERE path > ? AND path < ? ORDER BY path',
+            (prefix, path + u'\x20'))
+        root = {}
+        # lists are built as dicts of indexes first, the rows not being in
+        # numeric order
+        nodes, lists = {path: root}, [] if kind == _DICT else [(None, None, path)]
+        for child, child_kind, value in rows:
+            parent, _, name = child.rpartition(_SEPARATOR)
+            if child_kind == _VALUE:
+                nodes[parent][name] = json.loads(value)
+                continue
+            nodes[child] = nodes[parent][name] = {}
+            if child_kind == _LIST:
+                lists.append((parent, name, child))
+        # innermost lists first, so that they are complete when their parent is
+        for parent, name, child in sorted(lists, key=lambda item: -len(item[2])):
+            items = nodes[child]
+            converted = [items[index] for index in sorted(items, key=int)]
+            if parent is None:
+                return converted
+            nodes[parent][name] = nodes[child] = converted
+        return root
+
+
+def query_file(file, fmt, keys, index=False):
+    """Returns the values of the dotted keys in the file, in order, as plain
+    Python objects. Raises KeyError for a missing key. Values JSON can't
+    hold, like YAML dates, are read from an index as strings.
+
+    With ``index``, values are read from the index of the file when it is up
+    to date, otherwise the index is built from the parsed document. Without,
+    JSON files are memory-mapped and only the values asked for are decoded,
+    see MappedJSON.
+    """
+    from .collection import DottedCollection
+    from .sde import read_file
+
+    if index:
+        found = PathIndex.open(file)
+        if found is not None:
+            with found:
+                return [_lookup(found.get, key, file) for key in keys]
+    elif fmt == 'JSON' and os.path.isfile(file):
+        from .mapped import MappedJSON
+        from .streaming import Unsupported
+
+        try:
+            with MappedJSON(file) as mapped:
+                return [_lookup(mapped.get, key, file) for key in keys]
+        except Unsupported:
+            # keys set more than once are read from the parsed document
+            pass
+    identity = file_identity(file)
+    document = read_file(file, fmt)
+    data = DottedCollection.factory(document, lazy=True)
+    values = [_plain(_lookup(data.__getitem__, key, file)) for key in keys]
+    if index and identity is not None:
+        PathIndex.build(file, document, identity)
+    return values
+
+
+def _lookup(get, key, file):
+    try:
+        return get(key)
+    except (KeyError, IndexError):
+        raise KeyError('{} is not present in {}'.format(key, file))
+
+
+def format_value(value):
+    """Formats a value for printing: strings as they are, anything else as
+    JSON. Values JSON can't hold, like YAML dates, are printed as strings
+    too, as they are stored in an index."""
+    if isinstance(value, string_types):
+        return value
+    if value is None or isinstance(value, (dict, list, numbers.Number)):
+        return json.dumps(value, default=str, ensure_ascii=False)
+    return text_type(value)
+
+
+def main(argv=None):
+    """The entrypoint of the sdg command."""
+    import argparse
+    from .sde import file_format
+
+    parser = argparse.ArgumentParser(description='Simple data getter.', prog='sdg',
+                                     usage='%(prog)s [options] <key> [<key> ...] <filename>')
+    parser.add_argument('args', metavar='<key> [<key> ...] <filename>', nargs='+',
+                        help='Keys to read, one value is printed per line, and filename to read')
+    parser.add_argument('-i', '--index', dest='index', action='store_true',
+                        help='Keep an index of the file next to it ({}) to read values from it '
+                             'while the file is unchanged'.format('<filename>' + INDEX_SUFFIX))
+    parser.add_argument('--version', action='version',
+                        version='%(prog)s {version}'.format(version=__version__))
+    parser.set_defaults(index=False)
+    args = parser.parse_args(argv)
+    if len(args.args) < 2:
+        parser.error('expected <key> [<key> ...] <filename>')
+    keys, file = args.args[:-1], args.args[-1]
+
+    try:
+        fmt = file_format(file)
+        if not os.path.exists(file):
+            raise ValueError('{} does not exist'.format(file))
+        values = query_file(file, fmt, keys, index=args.index)
+    except (ValueError, KeyError) as e:
+        print("\033[91mError: \033[0m" + e.args[0], file=sys.stderr)
+        sys.exit(1)
+    for value in values:
+        print(format_value(value))
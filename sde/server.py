@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+A long running sde process serving edits over a Unix domain socket.
+
+Starting Python and importing the parsers takes far longer than a typical
+edit. ``sde --server`` pays for it once, then runs the command lines sent by
+clients, one at a time, so edits to the same file never race. With
+``SDE_SOCKET`` set to the socket path, ``sde`` only forwards its command line
+to the server and prints what it answers, falling back to editing by itself
+when no server listens there.
+
+The protocol is one JSON object per line each way: the client sends
+``{"argv": [...], "cwd": "...", "stdin": "..."}`` (``stdin`` only when the
+command line reads it) and the server answers
+``{"status": 0, "stdout": "...", "stderr": "..."}``.
+"""
+from __future__ import print_function
+
+import errno
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import traceback
+from contextlib import closing
+
+import six
+from six import StringIO
+from six.moves import socketserver
+
+from .cache import enable_cache
+
+
+def default_address():
+    """Returns the socket path used when none is given: sde-<uid>.sock in the
+    user's runtime directory, or in the temporary directory."""
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory, 'sde-{}.sock'.format(os.getuid()))
+
+
+def run(argv, cwd=None, stdin=None):
+    """Runs an sde command line in this process, as the server does for its
+    clients. Returns the response: exit status and captured output."""
+    from .sde import run_cli
+
+    out, err = _output(), StringIO()
+    saved = sys.stdout, sys.stderr, sys.stdin, os.getcwd()
+    status = 0
+    try:
+        sys.stdout, sys.stderr = out, err
+        if stdin is not None:
+            sys.stdin = _input(stdin)
+        if cwd:
+            os.chdir(cwd)
+        run_cli(argv)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            err.write(str(e.code) + '\n')
+            status = 1
+    except Exception:  # skipcq: PYL-W0703
+        # a bug in one request must not take the server down
+        err.write(traceback.format_exc())
+        status = 1
+    finally:
+        sys.stdout, sys.stderr, sys.stdin = saved[:3]
+        os.chdir(saved[3])
+    out.flush()
+    output = out.buffer.getvalue().decode('utf-8') if six.PY3 else out.getvalue()
+    return {'status': status, 'stdout': output, 'stderr': err.getvalue()}
+
+
+def _input(data):
+    """Returns a stdin replacement reading data, with a buffered binary
+    stream underneath like the real one."""
+    if six.PY2:
+        return StringIO(data)
+    return io.TextIOWrapper(io.BufferedReader(io.BytesIO(data.encode('utf-8'))),
+                            encoding='utf-8', newline='')
+
+
+def _output():
+    """Returns a stdout replacement capturing what is written to it, as text
+    or through its binary stream."""
+    if six.PY2:
+        return StringIO()
+    return io.TextIOWrapper(io.BytesIO(), encoding='utf-8', newline='')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answers each request line of a connection in turn."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = run(request['argv'], request.get('cwd'), request.get('stdin'))
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'status': 1, 'stdout': '', 'stderr': 'Invalid request: {}\n'.format(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+def _listening(address):
+    """Tells whether a server is already accepting connections at address."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with closing(sock):
+        try:
+            sock.connect(address)
+        except socket.error:
+            return False
+    return True
+
+
+def serve(address=None):
+    """Serves edits on the Unix domain socket at address until interrupted.
+    The socket is only accessible to the user running the server."""
+    address = address or default_address()
+    # repeated edits of unchanged files skip parsing them again
+    enable_cache()
+    if os.path.exists(address):
+        if _listening(address):
+            raise ValueError('an sde server already listens on {}'.format(address))
+        # left behind by a server that did not shut down cleanly
+        os.unlink(address)
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(address, _Handler)
+    finally:
+        os.umask(umask)
+    print('Listening on {}'.format(address), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(address)
+
+
+def request(address, argv):
+    """Sends a command line to the server at address and prints its output.
+    Returns the exit status, or None if no server listens there."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with closing(sock):
+        try:
+            sock.connect(address)
+        except socket.error as e:
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        payload = {'argv': list(argv), 'cwd': os.getcwd()}
+        if '-' in argv:
+            payload['stdin'] = sys.stdin.read()
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        with closing(sock.makefile('rb')) as fp:
+            line = fp.readline()
+    if not line:
+        print('\033[91mError: \033[0mthe sde server closed the connection', file=sys.stderr)
+        return 1
+    response = json.loads(line.decode('utf-8'))
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
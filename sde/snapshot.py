@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Dotted documents shared between threads, read through immutable snapshots.
+
+A SnapshotDict holds its document as plain dicts and lists that are never
+modified once published. Readers take the current Snapshot, a single
+attribute read, and look paths up in it without any lock, while it stays the
+same whatever writers do meanwhile. Writers are serialized by a lock and
+produce a new version of the document: like with lazy DottedDict wrappers,
+only the dicts and lists along the edited paths are copied, everything else
+is shared with the previous version. The new version is then published by
+replacing the current snapshot at once, so readers see either all the edits
+of an update or none of them.
+"""
+
+import copy
+import threading
+
+from six import string_types
+
+from .collection import DottedCollection, DottedDict, KeyPath
+
+
+def _plain(value):
+    """Returns a private copy of a value, as plain Python, validating that
+    it holds no dotted keys."""
+    if isinstance(value, DottedCollection):
+        value = value.to_python()
+    value = DottedCollection.factory(copy.deepcopy(value))
+    return value.to_python() if isinstance(value, DottedCollection) else value
+
+
+class Snapshot(object):
+    """A read-only view of a version of a SnapshotDict, or of a dict or list
+    inside it. Values are looked up by dotted keys like with DottedDict,
+    nested dicts and lists being returned as Snapshots too."""
+
+    __slots__ = ('store', 'version')
+
+    def __init__(self, store, version=0):
+        self.store = store
+        self.version = version
+
+    def get_path(self, path):
+        """Returns the value at a dotted key or KeyPath. Raises KeyError or
+        IndexError, like DottedCollection does, for missing values."""
+        parts = KeyPath.parse(path).parts
+        node = self.store
+        for i, part in enumerate(parts):
+            if isinstance(node, dict):
+                node = node[part]
+            elif isinstance(node, list):
+                if not part.isdigit():
+                    raise IndexError('cannot use %s as index in %s' % (part, repr(node)))
+                node = node[int(part)]
+            else:
+                raise KeyError('cannot get "{0}" in "{1}" ({2})'.format(
+                    ".".join(parts[i:]), ".".join(parts[:i]), repr(node)))
+        if isinstance(node, (dict, list)):
+            return Snapshot(node, self.version)
+        return node
+
+    def __getitem__(self, key):
+        if isinstance(key, int) and isinstance(self.store, list):
+            key = str(key)
+        return self.get_path(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def __contains__(self, key):
+        if not isinstance(key, (string_types, KeyPath)):
+            return False
+        try:
+            self.get_path(key)
+        except (KeyError, IndexError):
+            return False
+        return True
+
+    def __iter__(self):
+        """Iterates over the keys of a dict, or the values of a list."""
+        if isinstance(self.store, dict):
+            return iter(self.store)
+        return (Snapshot(value, self.version) if isinstance(value, (dict, list)) else value
+                for value in self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __eq__(self, other):
+        if isinstance(other, (Snapshot, DottedCollection)):
+            other = other.store
+        return self.store == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Snapshot(%r)' % (self.store,)
+
+    def to_python(self):
+        """Returns a copy of the data as plain Python the caller may modify."""
+        return copy.deepcopy(self.store)
+
+
+class SnapshotDict(object):
+    """A dotted dict for many reader threads and a few writer ones.
+
+    Reads go through the current snapshot and never wait for writers. Every
+    update publishes a new snapshot, copying only the nodes along the edited
+    paths, so holding on to an old snapshot costs the memory of what changed
+    since, rather than a deep copy of the document.
+    """
+
+    def __init__(self, initial=None):
+        self._lock = threading.Lock()
+        self._current = Snapshot(_plain({} if initial is None else initial))
+        if not isinstance(self._current.store, dict):
+            raise ValueError('initial value must be a dict')
+
+    def snapshot(self):
+        """Returns the current version of the document."""
+        return self._current
+
+    @property
+    def version(self):
+        """The number of updates made so far."""
+        return self._current.version
+
+    def _publish(self, edit):
+        """Calls edit with a lazy DottedDict over the current version, and
+        publishes what it made of it. Nothing is published if edit raises."""
+        with self._lock:
+            current = self._current
+            data = DottedDict(current.store, lazy=True)
+            edit(data)
+            self._current = Snapshot(data.to_python(), current.version + 1)
+
+    def update(self, edits):
+        """Sets the values of (dotted key, value) pairs, as a single new
+        version. Values are copied, changing them afterwards has no
+        effect."""
+        edits = [(KeyPath.parse(key), _plain(value)) for key, value in edits]
+
+        def edit(data):
+            for key, value in edits:
+                data.set_path(key, value)
+
+        self._publish(edit)
+
+    def delete(self, key):
+        """Deletes the value at a dotted key. Raises KeyError or IndexError
+        if there is none."""
+        self._publish(lambda data: data.delete_path(key))
+
+    def __getitem__(self, key):
+        return self._current[key]
+
+    def __setitem__(self, key, value):
+        self.update([(key, value)])
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def get(self, key, default=None):
+        return self._current.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._current
+
+    def __iter__(self):
+        return iter(self._current)
+
+    def __len__(self):
+        return len(self._current)
+
+    def __repr__(self):
+        return 'SnapshotDict(%r)' % (self._current.store,)
+
+    def to_python(self):
+        return self._current.to_python()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the streaming editors (see jsonstream and yamlstream).
+"""
+
+import io
+
+#: How many bytes or characters are read or copied at once
+CHUNK_SIZE = 64 * 1024
+
+
+class Unsupported(Exception):
+    """Raised when an edit can't be done by a streaming editor, so the caller
+    has to fall back to loading and writing the whole document."""
+
+
+def copy(src, dst, length=None, chunk_size=CHUNK_SIZE):
+    """Copies length bytes (or characters for text streams), or everything
+    left, from src to dst in chunks."""
+    while length is None or length > 0:
+        size = chunk_size if length is None else min(chunk_size, length)
+        chunk = src.read(size)
+        if not chunk:
+            break
+        dst.write(chunk)
+        if length is not None:
+            length -= len(chunk)
+
+
+def skip(src, length, chunk_size=CHUNK_SIZE):
+    """Reads and drops length bytes or characters from src."""
+    while length > 0:
+        chunk = src.read(min(chunk_size, length))
+        if not chunk:
+            break
+        length -= len(chunk)
+
+
+def locate_edit(editor, src, key, value, name, must_exist=False):
+    """Locates the span of an edit with a streaming editor, jsonstream or
+    yamlstream. Returns the span and the data replacing it, or None if the
+    value already matched. With must_exist, a missing key raises ValueError
+    naming the edited file. Keys with wildcards or slices are Unsupported."""
+    from .collection import KeyPath
+
+    if KeyPath.parse(key).pattern:
+        raise Unsupported('{} matches many values'.format(key))
+    try:
+        span = editor.locate(src, key)
+    except KeyError:
+        if must_exist:
+            raise ValueError('{} is not present in {}'.format(key, name))
+        raise
+    if span.missing:
+        if must_exist:
+            raise ValueError('{} is not present in {}'.format(key, name))
+    else:
+        current = span.value(src)
+        if current == value and type(current) == type(value):
+            return None
+    return span, span.render(value)
+
+
+class Bounded(object):
+    """Wraps a stream so that reading more than limit bytes or characters
+    from it raises Unsupported, bounding the cost of a streaming pass that is
+    only worth doing when it ends early."""
+
+    def __init__(self, fp, limit):
+        self.fp = fp
+        self.limit = limit
+        self.count = 0
+
+    def read(self, size=-1):
+        if self.count >= self.limit:
+            raise Unsupported('gave up after reading {} bytes'.format(self.limit))
+        chunk = self.fp.read(size)
+        self.count += len(chunk)
+        return chunk
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.fp.seek(offset, whence)
+
+    def tell(self):
+        return self.fp.tell()
+
+
+class PipeSource(object):
+    """Makes a stream that can't seek, like stdin, usable by the streaming
+    editors.
+
+    Everything read is kept, so that the editors can seek back to any offset
+    while they locate the edited value. Once ``forward`` is called, what was
+    read is dropped instead: the source can then only seek forward, and the
+    rest of the input is copied through in constant memory.
+    """
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        # what was read and kept, starting at offset base
+        self.store = None
+        self.base = 0
+        self.size = 0
+        self.pos = 0
+        self._forward = False
+        self._eof = False
+
+    def _fill(self, end=None):
+        """Reads from the stream until the input up to end, or all of it, is
+        kept."""
+        while not self._eof and (end is None or self.base + self.size < end):
+            chunk = self.fp.read(self.chunk_size)
+            if not chunk:
+                self._eof = True
+                break
+            if self.store is None:
+                self.store = io.BytesIO() if isinstance(chunk, bytes) else io.StringIO()
+            self.store.seek(0, io.SEEK_END)
+            self.store.write(chunk)
+            self.size += len(chunk)
+
+    def _drop(self):
+        """Drops what is before the current offset, when going forward. The
+        kept input is only compacted once most of it was read, so that
+        copying it out does not take quadratic time."""
+        if not self._forward or self.pos - self.base < max(self.chunk_size, self.size // 2):
+            return
+        self._fill(self.pos)
+        if self.store is None:
+            self.base = self.pos
+            return
+        self.store.seek(min(self.pos - self.base, self.size))
+        rest = self.store.read()
+        self.store = type(self.store)(rest)
+        self.base, self.size = self.pos, len(rest)
+
+    def forward(self):
+        """Stops keeping what is read."""
+        self._forward = True
+        self._drop()
+
+    @property
+    def forwarded(self):
+        """True once forward was called, the input can't be read again."""
+        return self._forward
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence != io.SEEK_SET or offset < self.base:
+            raise io.UnsupportedOperation('cannot seek back to dropped input')
+        self.pos = offset
+        self._drop()
+        return offset
+
+    def read(self, size=-1):
+        end = None if size is None or size < 0 else self.pos + size
+        self._fill(end)
+        if self.store is None:
+            return self.fp.read(0)
+        self.store.seek(self.pos - self.base)
+        data = self.store.read(-1 if end is None else max(0, end - self.pos))
+        self.pos += len(data)
+        self._drop()
+        return data
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Per-phase timings of edits.
+
+While timings are enabled, the phases of an edit (reading, wrapping the
+document, applying the edits, serializing, writing, renaming...) record the
+wall time spent in them and, with tracemalloc, the peak of memory allocated
+while they ran. Time spent in a phase nested in another one is only counted
+for the nested phase. When disabled, phases cost a function call.
+"""
+
+import json
+import time
+
+_timings = None
+
+# a monotonic clock where there is one
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class _NoPhase(object):
+    """What phase returns while timings are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase(object):
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+        self.start = self.nested = 0.0
+        self.peak = 0
+
+    def __enter__(self):
+        self.timings._enter(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings._exit(self)
+        return False
+
+
+class Timings(object):
+    """The phases recorded while timings are enabled, in the order they
+    first ran."""
+
+    def __init__(self, memory=True):
+        self.tracemalloc = None
+        self._tracing = False
+        if memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                pass
+            else:
+                # tracing started by someone else is left running
+                self._tracing = not tracemalloc.is_tracing()
+                if self._tracing:
+                    tracemalloc.start()
+                self.tracemalloc = tracemalloc
+        self.start = _clock()
+        self.end = None
+        # name -> [seconds, calls, peak bytes or None]
+        self.phases = {}
+        self.order = []
+        self._stack = []
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def _peak(self):
+        """Returns the peak of traced memory since the last reset."""
+        return self.tracemalloc.get_traced_memory()[1]
+
+    def _reset_peak(self):
+        # only Python 3.9+ can reset it, the peak is then the overall one
+        reset = getattr(self.tracemalloc, 'reset_peak', None)
+        if reset is not None:
+            reset()
+
+    def _enter(self, phase):
+        if self.tracemalloc is not None:
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak = max(parent.peak, self._peak())
+            self._reset_peak()
+        self._stack.append(phase)
+        phase.start = _clock()
+
+    def _exit(self, phase):
+        elapsed = _clock() - phase.start
+        self._stack.pop()
+        peak = None
+        if self.tracemalloc is not None:
+            peak = max(phase.peak, self._peak())
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            self._reset_peak()
+        if self._stack:
+            self._stack[-1].nested += elapsed
+        entry = self.phases.get(phase.name)
+        if entry is None:
+            entry = self.phases[phase.name] = [0.0, 0, peak]
+            self.order.append(phase.name)
+        entry[0] += elapsed - phase.nested
+        entry[1] += 1
+        if peak is not None:
+            entry[2] = max(entry[2], peak)
+
+    def stop(self):
+        """Stops recording."""
+        self.end = _clock()
+        if self._tracing:
+            self.tracemalloc.stop()
+
+    def to_dict(self):
+        """Returns the timings as plain Python, for JSON."""
+        end = self.end if self.end is not None else _clock()
+        return {
+            'total_seconds': end - self.start,
+            'phases': [{
+                'name': name,
+                'seconds': self.phases[name][0],
+                'calls': self.phases[name][1],
+                'peak_bytes': self.phases[name][2],
+            } for name in self.order],
+        }
+
+    def format(self, fmt='text'):
+        """Returns the timings as JSON or human-readable text."""
+        timings = self.to_dict()
+        if fmt == 'json':
+            return json.dumps(timings, sort_keys=True)
+        lines = []
+        for phase in timings['phases']:
+            line = '{:<12} {:>12.3f} ms {:>6}x'.format(
+                phase['name'], phase['seconds'] * 1000, phase['calls'])
+            if phase['peak_bytes'] is not None:
+                line += '   peak {:.1f} MiB'.format(phase['peak_bytes'] / 1048576.0)
+            lines.append(line)
+        lines.append('{:<12} {:>12.3f} ms'.format('total', timings['total_seconds'] * 1000))
+        return '\n'.join(lines)
+
+
+class TimedFile(object):
+    """Wraps a file object, recording its writes as the write phase."""
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, data):
+        with phase('write'):
+            return self.fp.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+    def __enter__(self):
+        self.fp.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.fp.__exit__(*exc_info)
+
+
+def enable_timings(memory=True):
+    """Starts recording the phases of edits, with their peak memory use
+    unless memory is False. Returns the Timings recorded into."""
+    global _timings
+    _timings = Timings(memory)
+    return _timings
+
+
+def disable_timings():
+    """Stops recording, returning the Timings recorded, or None."""
+    global _timings
+    timings, _timings = _timings, None
+    if timings is not None:
+        timings.stop()
+    return timings
+
+
+def timings():
+    """Returns the Timings being recorded, or None when disabled."""
+    return _timings
+
+
+def phase(name):
+    """Returns a context manager recording the time spent in it as the named
+    phase."""
+    if _timings is None:
+        return _NO_PHASE
+    return _timings.phase(name)
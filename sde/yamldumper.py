@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+YAML dumpers for DottedCollection, kept apart so that PyYAML is only imported
+when YAML is actually dumped.
+"""
+
+import yaml
+from yaml.events import (AliasEvent, MappingEndEvent, MappingStartEvent, ScalarEvent,
+                         SequenceEndEvent, SequenceStartEvent)
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+from . import backends
+from .collection import DottedCollection, walk
+
+_MAP_TAG = 'tag:yaml.org,2002:map'
+_SEQ_TAG = 'tag:yaml.org,2002:seq'
+
+
+def _exhaust(nodes):
+    """Walks the nodes of walk for their side effects only."""
+    for _ in nodes:
+        pass
+
+
+def _simple(node):
+    """Returns True for the nodes a collection holding only them is written in
+    flow style for, when the flow style is left to the representer."""
+    return isinstance(node, ScalarNode) and not node.style
+
+
+class DottedYAMLRepresenter(object):
+    """
+    We could do,
+
+        dumper.add_representer(DottedDict, lambda dumper, data: data.store)
+
+    But we'd have to do it for each type.
+
+    This suggests making a custom dumper for a hierarchy of types:
+        https://github.com/yaml/pyyaml/issues/51
+
+    Plain dicts and lists are represented the way PyYAML does, but level by
+    level with walk rather than recursively, so documents of any depth can be
+    dumped.
+    """
+
+    def _nested(self, data):
+        """Returns the dict or list in data to represent level by level, or
+        None."""
+        if isinstance(data, DottedCollection):
+            data = data.store
+        if type(data) in (dict, list) and id(data) not in self.represented_objects:
+            return data
+        return None
+
+    def represent_data(self, data):
+        """This is called by the representer for each object."""
+        if isinstance(data, DottedCollection):
+            data = data.store
+        if self._nested(data) is None:
+            return super(DottedYAMLRepresenter, self).represent_data(data)
+        nodes = []
+
+        def represent(data):
+            self.object_keeper.append(data)
+            value = []
+            mapping = isinstance(data, dict)
+            if mapping:
+                node = MappingNode(_MAP_TAG, value)
+                items = list(data.items())
+                if self.sort_keys:
+                    try:
+                        items = sorted(items)
+                    except TypeError:
+                        pass
+            else:
+                node = SequenceNode(_SEQ_TAG, value)
+                items = data
+            # recursive data refers to this node
+            self.represented_objects[id(data)] = node
+            best_style = True
+            for item in items:
+                if mapping:
+                    node_key, item = self.represent_data(item[0]), item[1]
+                    best_style = best_style and _simple(node_key)
+                nested = self._nested(item)
+                if nested is None:
+                    node_item = self.represent_data(item)
+                else:
+                    yield nested
+                    node_item = nodes.pop()
+                best_style = best_style and _simple(node_item)
+                value.append((node_key, node_item) if mapping else node_item)
+            if self.default_flow_style is not None:
+                node.flow_style = self.default_flow_style
+            else:
+                node.flow_style = best_style
+            nodes.append(node)
+
+        _exhaust(walk(data, represent))
+        return nodes.pop()
+
+
+class DottedYAMLDumper(DottedYAMLRepresenter, yaml.Dumper):
+    """A YAML dumper for DottedCollection, in pure Python. Nodes are anchored
+    and serialized with walk, like they are represented."""
+
+    def anchor_node(self, node):
+        anchors = self.anchors
+
+        def anchor(node):
+            anchors[node] = None
+            if isinstance(node, SequenceNode):
+                children = node.value
+            elif isinstance(node, MappingNode):
+                children = (child for pair in node.value for child in pair)
+            else:
+                return
+            for child in children:
+                if child not in anchors:
+                    yield child
+                elif anchors[child] is None:
+                    anchors[child] = self.generate_anchor(child)
+
+        if node not in anchors:
+            _exhaust(walk(node, anchor))
+        elif anchors[node] is None:
+            anchors[node] = self.generate_anchor(node)
+
+    def serialize_node(self, node, parent, index):
+
+        def serialize(item):
+            node, parent, index = item
+            alias = self.anchors[node]
+            if node in self.serialized_nodes:
+                self.emit(AliasEvent(alias))
+                return
+            self.serialized_nodes[node] = True
+            self.descend_resolver(parent, index)
+            if isinstance(node, ScalarNode):
+                detected_tag = self.resolve(ScalarNode, node.value, (True, False))
+                default_tag = self.resolve(ScalarNode, node.value, (False, True))
+                implicit = (node.tag == detected_tag), (node.tag == default_tag)
+                self.emit(ScalarEvent(alias, node.tag, implicit, node.value, style=node.style))
+            elif isinstance(node, SequenceNode):
+                implicit = (node.tag == self.resolve(SequenceNode, node.value, True))
+                self.emit(SequenceStartEvent(alias, node.tag, implicit, flow_style=node.flow_style))
+                for position, child in enumerate(node.value):
+                    yield child, node, position
+                self.emit(SequenceEndEvent())
+            elif isinstance(node, MappingNode):
+                implicit = (node.tag == self.resolve(MappingNode, node.value, True))
+                self.emit(MappingStartEvent(alias, node.tag, implicit, flow_style=node.flow_style))
+                for key, value in node.value:
+                    yield key, node, None
+                    yield value, node, key
+                self.emit(MappingEndEvent())
+            self.ascend_resolver()
+
+        _exhaust(walk((node, parent, index), serialize))
+
+
+if backends.has_libyaml():
+    class DottedYAMLCDumper(DottedYAMLRepresenter, yaml.CDumper):
+        """A YAML dumper for DottedCollection, emitting with libyaml"""
+else:
+    DottedYAMLCDumper = None
+
+
+def yaml_dumper():
+    """Returns the YAML dumper class for the backend in use."""
+    if backends.yaml_backend() == backends.YAML_C:
+        return DottedYAMLCDumper
+    return DottedYAMLDumper
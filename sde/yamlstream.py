@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Round-trip YAML editing.
+
+The document is parsed into events, without composing or constructing it,
+to find the node at the edited path. Only the text of that scalar is
+replaced (or a new entry inserted after the last one of its collection), the
+rest of the file, comments included, is copied through unchanged.
+"""
+
+import io
+
+import yaml
+from yaml.constructor import SafeConstructor
+from yaml.events import (AliasEvent, DocumentStartEvent, MappingEndEvent,
+                         MappingStartEvent, ScalarEvent, SequenceEndEvent,
+                         SequenceStartEvent, StreamEndEvent)
+from yaml.resolver import Resolver
+
+from .backends import yaml_loader
+from .collection import DottedCollection, KeyPath, yaml_dumper
+from .streaming import CHUNK_SIZE, Unsupported, copy, skip
+
+_STR_TAG = u'tag:yaml.org,2002:str'
+_MERGE_TAG = u'tag:yaml.org,2002:merge'
+_BLOCK_STYLES = ('|', '>')
+_RESOLVER = Resolver()
+# a line width both emitters take as "never wrap"
+_UNLIMITED_WIDTH = 1 << 30
+
+
+def _tag(event):
+    """Returns the tag a scalar event resolves to."""
+    if event.tag is not None and event.tag != u'!':
+        return event.tag
+    return _RESOLVER.resolve(yaml.ScalarNode, event.value, event.implicit)
+
+
+def _construct(event):
+    """Returns the value of a scalar event, as safe_load would load it."""
+    node = yaml.ScalarNode(_tag(event), event.value, style=event.style)
+    try:
+        return SafeConstructor().construct_object(node)
+    except yaml.YAMLError:
+        raise Unsupported('cannot load {!r}'.format(event.value))
+
+
+def encode(value):
+    """Encodes a value the way DottedCollection.to_yaml does, on a single line
+    and in flow style, so it fits both block and flow collections."""
+    text = yaml.dump([value], Dumper=yaml_dumper(), default_flow_style=True,
+                     width=_UNLIMITED_WIDTH).strip()
+    if '\n' in text:
+        raise Unsupported('{!r} does not fit on a single line'.format(value))
+    # drop the brackets of the list wrapping the value
+    return text[1:-1]
+
+
+class Span(object):
+    """The location of the scalar at a path inside a YAML document.
+
+    If the path exists, ``start`` and ``end`` are the character offsets of
+    the scalar. Otherwise ``missing`` holds the segments that have to be
+    created and ``start == end`` is the offset where the new entry goes; with
+    ``line_end`` the entry goes at the end of that line instead, after any
+    comment, and starts a line of its own. With ``append``, the value
+    rendered for missing segments is a new list holding it.
+    """
+
+    def __init__(self, start, end, event=None, missing=(), prefix=u'', line_end=False,
+                 append=False):
+        self.start = start
+        self.end = end
+        self.event = event
+        self.missing = tuple(missing)
+        # what goes before an inserted value: separator, indentation and key
+        self.prefix = prefix
+        self.line_end = line_end
+        self.append = append
+
+    def value(self, fp=None):
+        """Returns the existing value."""
+        return _construct(self.event)
+
+    def render(self, value):
+        """Returns the text replacing the span for the new value."""
+        if self.missing:
+            if self.append:
+                value = [value]
+            parts = self.missing[1:]
+            if parts:
+                data = DottedCollection._factory_by_index(parts[0])
+                data.set_path(KeyPath('.'.join(parts)), value)
+                value = data
+        return self.prefix + encode(value)
+
+
+def _next(events):
+    try:
+        return next(events)
+    except StopIteration:
+        raise ValueError('Unexpected end of YAML document')
+
+
+def _skip(events, event):
+    """Skips the node starting with the event and returns the last event with
+    some text in it, i.e. where the node ends."""
+    last = event
+    depth = 1 if isinstance(event, (MappingStartEvent, SequenceStartEvent)) else 0
+    while depth:
+        event = _next(events)
+        if isinstance(event, (MappingStartEvent, SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+            depth -= 1
+        if event.end_mark.index > event.start_mark.index:
+            last = event
+    return last
+
+
+def _is_key(event, part):
+    return isinstance(event, ScalarEvent) and event.value == part \
+        and _tag(event) == _STR_TAG
+
+
+def _is_merge(event):
+    return isinstance(event, ScalarEvent) and _tag(event) == _MERGE_TAG
+
+
+def _insertion(start, indent, last, end, count, missing, key=None, append=False):
+    """Returns the Span for a new entry added after the existing ones of the
+    collection opened by the start event and closed by the end event, at the
+    indent of its entries."""
+    entry = u'' if key is None else encode(key) + u': '
+    if start.flow_style:
+        separator = u', ' if count else u''
+        index = end.start_mark.index
+        return Span(index, index, missing=missing, prefix=separator + entry, append=append)
+    if isinstance(last, ScalarEvent) and last.style in _BLOCK_STYLES:
+        # a block scalar runs up to the next line already
+        raise Unsupported('cannot add an entry after a block scalar')
+    if key is None:
+        entry = u'- '
+    index = last.end_mark.index
+    return Span(index, index, missing=missing,
+                prefix=u'\n' + u' ' * indent + entry, line_end=True, append=append)
+
+
+def _key_indent(start, key):
+    """Returns the column keys of the block mapping opened by the start event
+    are at, its first key being given. The mapping starts where its first key
+    does, or at the ``?`` of an explicit key, unless an anchor or a tag on the
+    line before opens it."""
+    if start.start_mark.line == key.start_mark.line:
+        return start.start_mark.column
+    return key.start_mark.column
+
+
+def locate(fp, path, loader=None, append=False):
+    """Finds the span of the scalar at a dotted key or KeyPath in a text
+    stream holding a YAML document, parsed with the loader of the YAML
+    backend in use unless one is given. Raises KeyError or IndexError, like
+    DottedCollection does, if the path runs into a scalar or a list index
+    that can't be created, and Unsupported for paths through aliases or
+    merge keys and for values that are not plain or quoted scalars.
+
+    The whole document is parsed, so that invalid YAML fails like it does
+    with safe_load. Keys found twice on the path, the last one being the one
+    safe_load keeps, and streams of several documents raise Unsupported.
+
+    With ``append``, the path leads to a list and the span inserts a new
+    item after its last one, an empty path leading to the top-level list.
+    If the path is missing, the span creates it with a list holding the
+    item."""
+    parts = KeyPath.parse(path).parts if path else ()
+    events = yaml.parse(fp, Loader=loader or yaml_loader())
+    _next(events)
+    if not isinstance(_next(events), DocumentStartEvent):
+        raise Unsupported('empty document')
+    # the keys followed on the path, None for list indexes
+    followed = []
+    error = None
+    try:
+        span = _find(events, parts, followed, append)
+    except (KeyError, IndexError) as e:
+        error = e
+    _finish(events, followed)
+    if error is not None:
+        raise error
+    return span
+
+
+def _find(events, parts, followed, append):
+    """Does the work of locate, up to the node at the path."""
+    event = _next(events)
+    for i, part in enumerate(parts):
+        if isinstance(event, MappingStartEvent):
+            start, indent, last, count, merge, explicit = event, None, event, 0, False, False
+            key = _next(events)
+            while not isinstance(key, MappingEndEvent):
+                if indent is None:
+                    indent = _key_indent(start, key)
+                # the key of a block mapping is further right after a "?"
+                explicit = explicit or key.start_mark.column != indent
+                merge = merge or _is_merge(key)
+                _skip(events, key)
+                value = _next(events)
+                if _is_key(key, part):
+                    break
+                last = _skip(events, value)
+                count += 1
+                key = _next(events)
+            else:
+                if merge:
+                    raise Unsupported('cannot add keys next to a merge key')
+                if explicit and not start.flow_style:
+                    raise Unsupported('cannot add keys next to explicit "?" keys')
+                return _insertion(start, indent, last, key, count, parts[i:], part, append)
+            followed.append(part)
+            event = value
+        elif isinstance(event, SequenceStartEvent):
+            if not part.isdigit():
+                _skip(events, event)
+                raise IndexError('cannot use {0} as index'.format(part))
+            start, last, index, count = event, event, int(part), 0
+            while True:
+                event = _next(events)
+                if isinstance(event, SequenceEndEvent) or count == index:
+                    break
+                last = _skip(events, event)
+                count += 1
+            if isinstance(event, SequenceEndEvent):
+                if index != count:
+                    raise IndexError('list index out of range')
+                return _insertion(start, start.start_mark.column, last, event, count,
+                                  parts[i:], append=append)
+            followed.append(None)
+        elif isinstance(event, AliasEvent):
+            raise Unsupported('cannot edit through the alias *{0}'.format(event.anchor))
+        else:
+            raise KeyError('cannot set "{0}" in "{1}"'.format(
+                ".".join(parts[i:]), ".".join(parts[:i])))
+
+    if append:
+        if not isinstance(event, SequenceStartEvent):
+            raise Unsupported('only lists are appended to')
+        start, last, count = event, event, 0
+        event = _next(events)
+        while not isinstance(event, SequenceEndEvent):
+            last = _skip(events, event)
+            count += 1
+            event = _next(events)
+        return _insertion(start, start.start_mark.column, last, event, count, ())
+    if not isinstance(event, ScalarEvent):
+        raise Unsupported('only scalar values are replaced in place')
+    if event.anchor is not None or event.style in _BLOCK_STYLES:
+        raise Unsupported('cannot replace anchored or block scalars in place')
+    return Span(event.start_mark.index, event.end_mark.index, event)
+
+
+def _finish(events, followed):
+    """Parses the rest of the document once the node at the path was found,
+    the collections on the path being closed from the innermost one out."""
+    for part in reversed(followed):
+        event = _next(events)
+        while not isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+            if part is not None:
+                if _is_key(event, part):
+                    raise Unsupported('{0} is set more than once'.format(part))
+                _skip(events, event)
+                event = _next(events)
+            _skip(events, event)
+            event = _next(events)
+    # the end of the document, then of the stream
+    _next(events)
+    if not isinstance(_next(events), StreamEndEvent):
+        raise Unsupported('cannot edit a stream of several documents')
+
+
+def open_source(file):
+    """Opens a file for locate and splice."""
+    return io.open(file, encoding='utf-8', newline='')
+
+
+def open_target(fd):
+    """Opens the file descriptor splice writes to."""
+    return io.open(fd, 'w', encoding='utf-8', newline='')
+
+
+def splice(src, dst, span, data, chunk_size=CHUNK_SIZE):
+    """Writes the src text stream to dst with the span replaced by data."""
+    src.seek(0)
+    copy(src, dst, span.start, chunk_size)
+    if span.line_end:
+        while True:
+            chunk = src.read(chunk_size)
+            eol = chunk.find(u'\n')
+            if eol < 0:
+                dst.write(chunk)
+                if chunk:
+                    continue
+                dst.write(data)
+                return
+            if eol > 0 and chunk[eol - 1] == u'\r':
+                eol -= 1
+                data = data.replace(u'\n', u'\r\n')
+            dst.write(chunk[:eol])
+            dst.write(data)
+            dst.write(chunk[eol:])
+            break
+    else:
+        dst.write(data)
+        skip(src, span.end - span.start, chunk_size)
+    copy(src, dst, chunk_size=chunk_size)
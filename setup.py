@@ -15,7 +15,8 @@ _version_re = re.compile(r"__version__\s=\s'(.*)'")
 
 install_requires = [
     "six",
-    "pyyaml"
+    "pyyaml",
+    'futures; python_version < "3"'
 ]
 tests_requires = [
     "pytest>=4.4.0",
@@ -54,13 +55,14 @@ setup(
     license="BSD",
     install_requires=install_requires,
     extras_require={
+        "fast": ['orjson; python_version >= "3.6"'],
         "tests": install_requires + tests_requires,
         "docs": docs_requires,
         "build": install_requires + tests_requires + docs_requires,
     },
     tests_require=tests_requires,
     include_package_data=True,
-    entry_points={"console_scripts": ["sde = sde:main"]},
+    entry_points={"console_scripts": ["sde = sde:main", "sdg = sde.sdg:main"]},
     classifiers=[
         "Intended Audience :: Developers",
         "Intended Audience :: System Administrators",
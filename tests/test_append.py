@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+from sde import append_file, edit_file, read_file
+
+
+def test_append_in_place(tmpdir):
+    file = str(tmpdir.join('top.json'))
+    with open(file, 'w') as fp:
+        json.dump([{'id': 0}], fp, indent=4)
+    assert append_file('', {'id': 1}, file, 'JSON') is True
+    assert append_file('', 2, file, 'JSON', lock=True) is True
+    assert read_file(file, 'JSON') == [{'id': 0}, {'id': 1}, 2]
+    with open(file) as fp:
+        assert fp.read().endswith('    },\n    2\n]')
+    # the file is replaced, never left half written
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith('.tmp')]
+
+    file = str(tmpdir.join('nested.json'))
+    with open(file, 'w') as fp:
+        fp.write('{"meta": {"v": 1}, "log": {"entries": []}}\n')
+    append_file('log.entries', 'a', file, 'JSON')
+    append_file('log.entries', 'b', file, 'JSON')
+    with open(file) as fp:
+        assert fp.read() == '{"meta": {"v": 1}, "log": {"entries": ["a", "b"]}}\n'
+
+
+def test_append_yaml(tmpdir):
+    file = str(tmpdir.join('hosts.yaml'))
+    with open(file, 'w') as fp:
+        fp.write('# hosts\nhosts:\n- a  # first\n- b\n')
+    append_file('hosts', 'c', file, 'YAML')
+    with open(file) as fp:
+        assert fp.read() == '# hosts\nhosts:\n- a  # first\n- b\n- c\n'
+
+    with open(file, 'w') as fp:
+        fp.write('hosts: [a, b]\nother: 1\n')
+    append_file('hosts', 'c', file, 'YAML')
+    with open(file) as fp:
+        assert fp.read() == 'hosts: [a, b, c]\nother: 1\n'
+
+
+def test_append_fallback(tmpdir):
+    file = str(tmpdir.join('new.json'))
+    append_file('users', 'a', file, 'JSON')
+    append_file('groups.0.members', 'b', file, 'JSON')
+    assert read_file(file, 'JSON') == {'users': ['a'], 'groups': [{'members': ['b']}]}
+    with pytest.raises(ValueError):
+        append_file('users.0', 'c', file, 'JSON')
+
+    file = str(tmpdir.join('new.yaml'))
+    append_file('', 1, file, 'YAML')
+    append_file('', 2, file, 'YAML')
+    assert read_file(file, 'YAML') == [1, 2]
+
+    # missing lists are created in YAML files too
+    file = str(tmpdir.join('missing.yaml'))
+    with open(file, 'w') as fp:
+        fp.write('a: 1  # comment\nl: []\n')
+    append_file('hosts', 1, file, 'YAML')
+    append_file('missing.list', 1, file, 'YAML')
+    append_file('l.0.members', 'b', file, 'YAML')
+    append_file('hosts', 2, file, 'YAML')
+    assert read_file(file, 'YAML') == {'a': 1, 'hosts': [1, 2], 'missing': {'list': [1]},
+                                       'l': [{'members': ['b']}]}
+    with open(file) as fp:
+        assert fp.readline() == 'a: 1  # comment\n'
+
+    # setting the index right after the last item appends too
+    file = str(tmpdir.join('index.json'))
+    edit_file('list', [1], file, 'JSON')
+    assert edit_file('list.1', 2, file, 'JSON') is True
+    assert read_file(file, 'JSON') == {'list': [1, 2]}
+    with pytest.raises(ValueError):
+        edit_file('list.2', 3, file, 'JSON', must_exist=True)
+
+
+def test_cli_append(tmpdir):
+    file = str(tmpdir.join('cli.json'))
+    for value in ('1', '2'):
+        assert subprocess.call(['sde', '--append', 'list', value, file]) == 0
+    assert subprocess.call(['sde', '-a', '-k', 'list=3', '-k', 'other=x', file]) == 0
+    assert read_file(file, 'JSON') == {'list': [1, 2, 3], 'other': ['x']}
+    assert subprocess.call(['sde', '-a', 'list.0', '4', file], stderr=subprocess.PIPE) == 1
+
+    # values are parsed as JSON, and a trailing dot is allowed after the key
+    assert subprocess.call(['sde', '--append', 'users.', '{"name": "x"}', file]) == 0
+    assert subprocess.call(['sde', '-a', '-s', 'users', '{"name": "y"}', file]) == 0
+    assert subprocess.call(['sde', '-a', 'users', 'plain', file]) == 0
+    assert read_file(file, 'JSON')['users'] == [{'name': 'x'}, '{"name": "y"}', 'plain']
@@ -0,0 +1,164 @@
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from sde import backends, edit_file, query_file, sde
+from sde.collection import DottedDict, DottedJSONEncoder, yaml_dumper
+from sde.mapped import MappedJSON
+from sde.yamldumper import DottedYAMLCDumper, DottedYAMLDumper
+
+DATA = {
+    'name': 'John',
+    'unicode': u'ñandú',
+    'multiline': 'line 1\nline 2\n',
+    'long': ' '.join(['word'] * 50),
+    'values': [1, 1.5, -100.25, None, True, 'yes', '1', ''],
+    'nested': {'empty': {}, 'list': [[1, [2]], {'x': []}]},
+}
+
+
+@pytest.mark.skipif(not backends.has_libyaml(), reason='PyYAML built without libyaml')
+def test_yaml_backends_dump_the_same():
+    data = DottedDict(DATA)
+    try:
+        backends.set_yaml_backend('python')
+        assert yaml_dumper() is DottedYAMLDumper
+        python = data.to_yaml()
+        backends.set_yaml_backend('c')
+        assert yaml_dumper() is DottedYAMLCDumper
+        assert data.to_yaml() == python
+    finally:
+        backends.set_yaml_backend(None)
+
+
+@pytest.mark.parametrize('dumper', [DottedYAMLDumper, DottedYAMLCDumper])
+def test_yaml_dumpers_match_pyyaml(dumper):
+    if dumper is None:
+        pytest.skip('PyYAML built without libyaml')
+    shared = [1, 2]
+    recursive = {'name': 'loop'}
+    recursive['self'] = recursive
+    for data in (DATA, {'a': shared, 'b': {'c': shared}}, recursive, {1: 'int', 'str': (1, 2)}):
+        for options in ({}, {'default_flow_style': None}, {'sort_keys': False}):
+            assert yaml.dump(data, Dumper=dumper, **options) == yaml.dump(data, **options)
+
+
+def test_set_yaml_backend():
+    with pytest.raises(ValueError):
+        backends.set_yaml_backend('rust')
+    backends.set_yaml_backend('python')
+    try:
+        assert backends.yaml_backend() == 'python'
+        assert backends.yaml_loader().__name__ == 'SafeLoader'
+    finally:
+        backends.set_yaml_backend(None)
+
+
+def test_yaml_backend_environment():
+    env = dict(os.environ, SDE_YAML_BACKEND='python')
+    output = subprocess.check_output(
+        [sys.executable, '-c', 'from sde import backends; print(backends.yaml_backend())'],
+        env=env
+    )
+    assert output.strip() == b'python'
+
+
+JSON_DATA = {
+    'floats': [1.5, 1e-05, 1e-07, 1e16, 1e300, -0.0, 0.1, 100.0, 5e-324],
+    'strings': [u'ñandú \U0001F600', '"quoted" \\ /', 'line\nbreak\x7f', '1e5 0.00001'],
+    'empty': [{}, []],
+    'nested': {'null': None, 'true': True, 'list': [[1, [2]], {'x': []}]},
+}
+
+
+@pytest.mark.parametrize('name', backends.available_json_backends())
+def test_json_backends(name):
+    backends.set_json_backend(name)
+    try:
+        assert backends.json_backend() == name
+        text = json.dumps(JSON_DATA, indent=4)
+        assert backends.json_loads(text) == JSON_DATA
+        assert backends.json_dumps(JSON_DATA) == text
+        assert DottedDict(JSON_DATA).to_json() == text
+        # not valid JSON, but the standard library takes it
+        assert math.isnan(backends.json_loads('{"x": NaN}')['x'])
+        nan = {'x': float('nan'), 'y': None, 'big': 2 ** 70}
+        assert backends.json_dumps(nan) == json.dumps(nan, indent=4)
+        for value in ({'n': None, 'x': [(1, {'y': float('-inf')})]}, float('inf'), [None, 1.5]):
+            assert backends.json_dumps(value) == json.dumps(value, indent=4)
+    finally:
+        backends.set_json_backend(None)
+
+
+@pytest.mark.parametrize('name', backends.available_json_backends())
+def test_json_backends_keep_long_integers(name, tmpdir):
+    backends.set_json_backend(name)
+    try:
+        data = {'id': 12345678901234567890123, 'negative': -2 ** 64, 'max': 2 ** 64 - 1}
+        text = json.dumps(data)
+        assert backends.json_loads(text) == data
+        assert backends.json_loads(text.encode('utf-8')) == data
+        file = str(tmpdir.join('ids.json'))
+        with open(file, 'w') as fp:
+            fp.write(text)
+        edit_file('name', 'y', file, 'JSON')
+        with open(file) as fp:
+            assert json.load(fp) == dict(data, name='y')
+        with MappedJSON(file) as mapped:
+            assert mapped.get('id') == data['id']
+        assert query_file(file, 'JSON', ['negative']) == [data['negative']]
+    finally:
+        backends.set_json_backend(None)
+
+
+def test_json_encoder_matches_json():
+    data = dict(JSON_DATA, keys={1: 'int', 1.5: 'float', None: 'null', False: 'bool'})
+    for options in ({}, {'indent': 4}, {'indent': '\t'}, {'ensure_ascii': False},
+                    {'separators': (',', ':')}):
+        assert json.dumps(data, cls=DottedJSONEncoder, **options) == json.dumps(data, **options)
+    assert json.dumps(JSON_DATA, cls=DottedJSONEncoder, sort_keys=True) == \
+        json.dumps(JSON_DATA, sort_keys=True)
+    assert json.dumps(DottedDict(JSON_DATA), cls=DottedJSONEncoder, indent=4) == \
+        json.dumps(JSON_DATA, indent=4)
+
+
+def test_set_json_backend():
+    with pytest.raises(ValueError):
+        backends.set_json_backend('simplejson')
+
+
+@pytest.mark.parametrize('name', backends.available_json_backends())
+def test_json_dump_chunks(name):
+    backends.set_json_backend(name)
+    try:
+        writes = []
+        out = io.StringIO()
+        out_write = out.write
+        out.write = lambda chunk: writes.append(chunk) or out_write(chunk)
+        data = dict(JSON_DATA, items=[JSON_DATA] * 100)
+        backends.json_dump(data, out, cls=DottedJSONEncoder)
+        assert out.getvalue() == json.dumps(data, indent=4)
+        # written as it is encoded
+        assert len(writes) > 1
+    finally:
+        backends.set_json_backend(None)
+
+
+def test_write_file_streams(tmpdir, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(fd) or real_fsync(fd))
+    data = DottedDict(DATA)
+    for fmt, ext in (('JSON', 'json'), ('YAML', 'yaml')):
+        path = str(tmpdir.join('out.' + ext))
+        sde.write_file(path, fmt, data, fsync=True)
+        expected = data.to_json() if fmt == 'JSON' else data.to_yaml()
+        with open(path) as f:
+            assert f.read() == expected
+    assert len(synced) == 2
@@ -0,0 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'bench.py')
+
+
+def test_benchmarks(tmpdir):
+    baseline = str(tmpdir.join('baseline.json'))
+    bench = [sys.executable, BENCH, '--sizes', '2', '--repeat', '1', '--min-time', '0.001',
+             '--levels', '3', '--only', 'wrap']
+    subprocess.check_call(bench + ['--save', baseline])
+    with open(baseline) as fp:
+        saved = json.load(fp)
+    assert set(saved['results']) == {'wrap/2', 'wrap/lazy/2', 'memory/wrap/2', 'deep/wrap/3'}
+    assert saved['parameters']['sizes'] == [2]
+    assert saved['parameters']['levels'] == [3]
+
+    assert subprocess.call(bench + ['--compare', baseline, '--threshold', '1000']) == 0
+    saved['results'] = dict((name, 1e-12) for name in saved['results'])
+    with open(baseline, 'w') as fp:
+        json.dump(saved, fp)
+    assert subprocess.call(bench + ['--compare', baseline]) == 1
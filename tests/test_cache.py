@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from sde import disable_cache, edit_file, enable_cache, read_file
+from sde.cache import DocumentCache
+
+
+@pytest.fixture
+def cache():
+    yield enable_cache()
+    disable_cache()
+
+
+def test_read_file_cached(tmpdir, cache):
+    file = str(tmpdir.join('cached.json'))
+    with open(file, 'w') as fd:
+        json.dump({'name': 'John', 'nested': {'list': [1]}}, fd)
+
+    data = read_file(file, 'JSON')
+    assert read_file(file, 'JSON') is data
+    assert len(cache) == 1
+
+    edit_file('nested.list.0', 2, file, 'JSON')
+    # the cached document was not modified, but replaced by the written one
+    assert data == {'name': 'John', 'nested': {'list': [1]}}
+    written = read_file(file, 'JSON')
+    assert written == {'name': 'John', 'nested': {'list': [2]}}
+    assert edit_file('nested.list.0', 2, file, 'JSON') is False
+    assert read_file(file, 'JSON') is written
+
+    # changed behind the cache's back
+    with open(file, 'w') as fd:
+        json.dump({'name': 'Jack, with a longer name'}, fd)
+    assert read_file(file, 'JSON') == {'name': 'Jack, with a longer name'}
+
+
+def test_cache_bounds(tmpdir):
+    cache = DocumentCache(max_entries=2, max_bytes=10)
+    files = []
+    for i, content in enumerate(['1234', '1234', '12345678', '12345678901']):
+        file = str(tmpdir.join('{}.json'.format(i)))
+        with open(file, 'w') as fd:
+            fd.write(content)
+        files.append(file)
+
+    cache.put(files[0], 'JSON', 0)
+    cache.put(files[1], 'JSON', 1)
+    assert cache.get(files[0], 'JSON') == 0
+    # evicts the least recently used one, by size
+    cache.put(files[2], 'JSON', 2)
+    assert cache.get(files[1], 'JSON') is None
+    assert cache.get(files[0], 'JSON') is None
+    assert cache.get(files[2], 'JSON') == 2
+    assert cache.size == 8
+    # too large to be cached at all
+    cache.put(files[3], 'JSON', 3)
+    assert len(cache) == 1
+    assert cache.get(files[2], 'YAML') is None
+    assert len(cache) == 0
+    os.unlink(files[0])
+    cache.put(files[0], 'JSON', 0)
+    assert cache.size == 0
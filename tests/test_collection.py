@@ -0,0 +1,198 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from sde.collection import (DottedCollection, DottedDict, DottedJSONEncoder, DottedList, KeyPath,
+                            split_key)
+
+
+def test_lazy_wraps_only_the_walked_path():
+    raw = {'a': {'b': {'c': 1}}, 'other': {'x': [{'y': 2}]}}
+    data = DottedDict(raw, lazy=True)
+
+    assert isinstance(data.store['a'], dict)
+    assert data['a.b.c'] == 1
+    assert isinstance(data.store['a'], DottedDict)
+    assert isinstance(data.store['a'].store['b'], DottedDict)
+    # untouched branches are never wrapped
+    assert type(data.store['other']) is dict
+
+    data['other.x.0.y'] = 3
+    data['new.0.key'] = 'val'
+    assert data.to_python() == {
+        'a': {'b': {'c': 1}},
+        'other': {'x': [{'y': 3}]},
+        'new': [{'key': 'val'}],
+    }
+    # wrapping copies the nodes on the path, the original data is left intact
+    assert raw['other']['x'][0]['y'] == 2
+
+
+def test_lazy_validates_keys_on_access():
+    data = DottedDict({'ok': 1, 'nested': {'bad.key': 1}}, lazy=True)
+    assert data['ok'] == 1
+    try:
+        data['nested']
+        assert False, 'ValueError expected'
+    except ValueError:
+        pass
+
+    try:
+        DottedDict({'bad.key': 1}, lazy=True)
+        assert False, 'ValueError expected'
+    except ValueError:
+        pass
+
+
+def test_lazy_serialization():
+    data = DottedCollection.factory({'list': [{'a': 1}], 'dict': {'b': None}}, lazy=True)
+    assert isinstance(data, DottedDict)
+    data['list.1'] = {'c': True}
+    eager = DottedDict({'list': [{'a': 1}, {'c': True}], 'dict': {'b': None}})
+    assert data.to_json() == eager.to_json()
+    assert data.to_yaml() == eager.to_yaml()
+    assert DottedList([[1]], lazy=True)['0.0'] == 1
+
+
+def test_key_path():
+    path = KeyPath.parse(r'a.b\.c.0')
+    assert path.parts == ('a', r'b\.c', '0')
+    assert KeyPath.parse(r'a.b\.c.0') is path
+    assert KeyPath.parse(path) is path
+    assert list(path) == split_key(r'a.b\.c.0')
+
+
+def test_key_path_cache_is_bounded():
+    size = KeyPath.cache_size
+    KeyPath.cache_size = 4
+    try:
+        for i in range(10):
+            KeyPath.parse('bounded.%d' % i)
+        assert len(KeyPath._cache) <= 4
+        assert 'bounded.9' in KeyPath._cache
+        assert 'bounded.0' not in KeyPath._cache
+    finally:
+        KeyPath.cache_size = size
+
+
+def test_path_methods():
+    data = DottedDict({'users': [{'name': 'foo'}], r'dotted\.key': 1})
+    path = KeyPath.parse('users.0.name')
+
+    assert data.get_path(path) == 'foo'
+    assert data[path] == 'foo'
+    assert data.has_path(path)
+    assert path in data
+    assert data[r'dotted\.key'] == 1
+
+    data.set_path(path, 'bar')
+    data.set_path('users.1.name', 'baz')
+    data.set_path('extra.list.0', True)
+    assert data.to_python()['users'] == [{'name': 'bar'}, {'name': 'baz'}]
+    assert data['extra.list'].to_python() == [True]
+
+    data.delete_path('users.1')
+    assert not data.has_path('users.1')
+    assert not data.has_path('missing.key')
+    assert 'missing.key' not in data
+
+    try:
+        data.set_path('users.0.name.first', 'x')
+        assert False, 'KeyError expected'
+    except KeyError:
+        pass
+    try:
+        data['users.5.name']
+        assert False, 'IndexError expected'
+    except IndexError:
+        pass
+
+
+def test_set_all():
+    users = [{'name': str(i), 'enabled': i % 2 == 0} for i in range(10)]
+    raw = {'users': users + [None], 'groups': {'a': {}, 'b': {'x': 1}}}
+    data = DottedDict(raw, lazy=True)
+
+    assert KeyPath.parse('users.*.enabled').pattern
+    assert not KeyPath.parse('users.0.enabled').pattern
+    assert data.set_all('users.*.enabled', True) == 5
+    assert data.set_all('users.*.enabled', True) == 0
+    assert data.set_all('users.2:4.enabled', False) == 2
+    assert data.set_all('users.-2:.enabled', False) == 1
+    enabled = [user['enabled'] for user in data.to_python()['users'][:10]]
+    assert enabled == [True, True, False, False, True, True, True, True, True, False]
+
+    # new values are not shared between the matches
+    assert data.set_all('groups.*.tags', ['x']) == 2
+    data['groups.a.tags'].append('y')
+    assert data['groups.b.tags'].to_python() == ['x']
+    # the raw input is left alone
+    assert raw['groups'] == {'a': {}, 'b': {'x': 1}}
+
+    try:
+        data.set_all('groups.*.missing', 1, must_exist=True)
+        assert False, 'KeyError expected'
+    except KeyError:
+        pass
+
+
+def test_wrapper_memory():
+    tracemalloc = pytest.importorskip('tracemalloc')
+
+    def measure(build):
+        raw = {'items': [{'id': i, 'name': 'n', 'tags': ['a', 'b']} for i in range(5000)]}
+        tracemalloc.start()
+        try:
+            build(raw)
+            return tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+    # a wrapped tree costs its copy, as a deep copy does, plus the wrappers
+    overhead = measure(DottedCollection.factory) - measure(copy.deepcopy)
+    assert overhead / 10001.0 < 64
+
+    data = DottedDict({'a': {'b': 1}})
+    assert not hasattr(data, '__dict__')
+    assert copy.deepcopy(data).to_python() == {'a': {'b': 1}}
+    assert pickle.loads(pickle.dumps(data)).to_python() == {'a': {'b': 1}}
+
+
+def test_deep_documents():
+    # far deeper than the recursion limit
+    levels = 10000
+    document = 'leaf'
+    for _ in range(levels):
+        document = [{'key': document}]
+    data = DottedDict({'root': document})
+
+    path = 'root' + '.0.key' * levels
+    assert data[path] == 'leaf'
+    data[path] = 'edited'
+    node = data.to_python()['root']
+    for _ in range(levels):
+        assert type(node) is list and type(node[0]) is dict
+        node = node[0]['key']
+    assert node == 'edited'
+    assert document[0]['key'] != 'edited'
+
+    assert json.dumps(data, cls=DottedJSONEncoder) == \
+        '{"root": ' + '[{"key": ' * levels + '"edited"' + '}]' * levels + '}'
+
+    lists = 'leaf'
+    for _ in range(levels):
+        lists = [lists]
+    assert DottedDict({'root': lists}).to_yaml() == 'root:\n' + '- ' * levels + 'leaf\n'
+
+
+def test_circular_documents():
+    document = {'a': [1]}
+    document['a'].append(document)
+    with pytest.raises(ValueError):
+        DottedDict(document)
+    # shared values are not circular
+    shared = {'x': 1}
+    data = DottedDict({'a': shared, 'b': [shared, shared]})
+    assert data.to_python() == {'a': shared, 'b': [shared, shared]}
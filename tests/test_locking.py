@@ -0,0 +1,46 @@
+import os
+import subprocess
+import time
+
+from sde import edit_file, read_file
+from sde.locking import EditQueue, FileLock
+
+
+def test_group_commit(tmpdir):
+    file = str(tmpdir.join('shared.json'))
+    edit_file('base', 0, file, 'JSON')
+    queue = EditQueue(file)
+    first = queue.put([('a', 1), ('b', 2)])
+    failing = queue.put([('base', 3), ('missing', 4)], must_exist=True)
+    last = queue.put([('a', 5)])
+
+    # the lock is free: the queued edits are applied along with this one,
+    # except for the failing request as a whole
+    assert edit_file('own', True, file, 'JSON', lock=True) is True
+    assert read_file(file, 'JSON') == {'base': 0, 'own': True, 'a': 5, 'b': 2}
+    assert queue.take(first) == {'result': 2, 'error': None}
+    assert 'missing is not present' in queue.take(failing)['error']
+    assert queue.take(last) == {'result': 1, 'error': None}
+    assert queue.pending() == []
+
+
+def test_concurrent_edits(tmpdir):
+    file = str(tmpdir.join('manifest.yaml'))
+    edit_file('base', 0, file, 'YAML')
+    lock = FileLock(file)
+    lock.acquire()
+    try:
+        processes = [subprocess.Popen(['sde', '--lock', 'key{}'.format(i), str(i), file])
+                     for i in range(4)]
+        # wait for them to queue their edits while the lock is held
+        for _ in range(200):
+            if len(EditQueue(file).pending()) == 4:
+                break
+            time.sleep(0.05)
+    finally:
+        lock.release()
+    assert [process.wait() for process in processes] == [0] * 4
+    expected = dict(('key{}'.format(i), i) for i in range(4))
+    expected['base'] = 0
+    assert read_file(file, 'YAML') == expected
+    assert not os.path.exists(file + '.queue')
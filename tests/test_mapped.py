@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from sde import edit_file, query_file
+from sde.collection import DottedDict
+from sde.mapped import MappedJSON
+from sde.streaming import Unsupported
+
+DOCUMENT = {
+    'name': 'doc',
+    'items': [{'id': i, 'text': 'a "{[quoted]}" \\ value', 'tags': [], 'nested': {'v': i / 2.0}}
+              for i in range(50)],
+    'empty': {},
+    'flag': True,
+    'unicode': u'été',
+}
+
+
+@pytest.fixture
+def file(tmpdir):
+    file = str(tmpdir.join('mapped.json'))
+    with open(file, 'w') as fp:
+        json.dump(DOCUMENT, fp, indent=4)
+    return file
+
+
+def test_get(file):
+    data = DottedDict(DOCUMENT)
+    with MappedJSON(file) as mapped:
+        for key in ('name', 'items.49.text', 'items.3.nested', 'items.7.tags', 'empty', 'flag',
+                    'unicode', 'items.10.nested.v'):
+            value = data[key]
+            assert mapped.get(key) == getattr(value, 'to_python', lambda: value)()
+        # the same errors as DottedCollection
+        for key in ('missing', 'items.x', 'items.50', 'name.x', 'items.0.id.x'):
+            with pytest.raises(LookupError) as raised:
+                mapped.get(key)
+            with pytest.raises(raised.type):
+                data[key]
+
+
+def test_limit(file):
+    with MappedJSON(file, limit=1024) as mapped:
+        assert mapped.get('name') == 'doc'
+        with pytest.raises(Unsupported):
+            mapped.get('unicode')
+
+
+def test_lookups_do_not_parse(file, monkeypatch):
+    import sde.sde
+
+    def fail(*args):
+        raise AssertionError('the document was parsed')
+
+    monkeypatch.setattr(sde.sde, 'json_load', fail)
+    assert edit_file('items.30.nested.v', 15.0, file, 'JSON') is False
+    with pytest.raises(ValueError) as raised:
+        edit_file('items.30.missing', 1, file, 'JSON', must_exist=True)
+    assert 'items.30.missing is not present' in str(raised.value)
+    assert query_file(file, 'JSON', ['items.49.id', 'flag']) == [49, True]
+
+
+def test_duplicate_keys(tmpdir):
+    # json.loads keeps the last value of a key, including one spelled with escapes
+    file = str(tmpdir.join('duplicates.json'))
+    for text in ('{"a": {"b": 1, "c": {"b": 0}}, "b": 0, "a": {"b": 2}}',
+                 '{"a": {"b": 1}, "x": "\\"", "\\u0061": {"b": 2}}'):
+        with open(file, 'w') as fp:
+            fp.write(text)
+        with MappedJSON(file) as mapped:
+            with pytest.raises(Unsupported):
+                mapped.get('a.b')
+        assert query_file(file, 'JSON', ['a.b']) == [2]
+        assert edit_file('a.b', 1, file, 'JSON') is True
+        assert query_file(file, 'JSON', ['a.b']) == [1]
+
+    # the same key in other objects is not a duplicate
+    with open(file, 'w') as fp:
+        fp.write('{"a": {"b": 1, "c": {"b": 0}}, "d": [{"b": 3}]}')
+    with MappedJSON(file) as mapped:
+        assert mapped.get('a.b') == 1
+        assert mapped.get('d.0.b') == 3
@@ -0,0 +1,70 @@
+import io
+import json
+
+import pytest
+
+from sde import edit_file_records
+from sde.records import edit_records, split_yaml
+
+YAML_STREAM = u'''# header
+%YAML 1.1
+---
+name: a  # kept
+n: 1
+--- # second
+name: b
+n: 1
+...
+---
+name: &x c
+alias: *x
+'''
+
+
+def test_split_yaml():
+    documents = list(split_yaml(io.StringIO(YAML_STREAM)))
+    assert len(documents) == 3
+    assert u''.join(documents) == YAML_STREAM
+    assert documents[1].startswith(u'--- # second') and documents[1].endswith(u'...\n')
+
+
+def test_edit_yaml_records(tmpdir):
+    file = str(tmpdir.join('stream.yaml'))
+    with io.open(file, 'w', encoding='utf-8') as fd:
+        fd.write(YAML_STREAM)
+
+    assert edit_file_records(file, 'YAML', [('n', 2)], where=[('name', 'b')]) == 1
+    with io.open(file, encoding='utf-8') as fd:
+        assert fd.read() == YAML_STREAM.replace(u'b\nn: 1', u'b\nn: 2')
+
+    # the alias can't be edited in place, so the last document is dumped again
+    assert edit_file_records(file, 'YAML', [('alias', 'd')], where=[('name', 'c')]) == 1
+    with io.open(file, encoding='utf-8') as fd:
+        assert fd.read().endswith(u'---\nalias: d\nname: c\n')
+    assert edit_file_records(file, 'YAML', [('alias', 'd')], where=[('name', 'c')]) == 0
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_edit_json_records(tmpdir, jobs):
+    file = str(tmpdir.join('log.ndjson'))
+    with open(file, 'w') as fd:
+        for i in range(2500):
+            fd.write(json.dumps({'id': i, 'even': i % 2 == 0}, separators=(',', ':')) + '\n')
+
+    edits = [('meta.seen', True)]
+    assert edit_file_records(file, 'JSON', edits, where=[('even', True)], jobs=jobs) == 1250
+    with open(file) as fd:
+        lines = fd.read().splitlines()
+    assert len(lines) == 2500
+    assert lines[0] == '{"id":0,"even":true,"meta": {"seen": true}}'
+    assert lines[1] == '{"id":1,"even":false}'
+
+    with pytest.raises(ValueError):
+        edit_file_records(file, 'JSON', [('meta.seen', False)], must_exist=True)
+
+
+def test_edit_records_batches():
+    records = [json.dumps({'i': i}).encode('utf-8') for i in range(10)]
+    results = list(edit_records(iter(records), 'JSON', [('i', 0)], jobs=2, batch_size=3))
+    assert [text for text, _ in results] == records
+    assert [edited for _, edited in results][:2] == [None, b'{"i": 0}']
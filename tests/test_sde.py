@@ -2,7 +2,7 @@ import os
 import subprocess
 import json
 import yaml
-from sde import edit_file, normalize_val, read_file
+from sde import edit_file, edit_file_count, edit_file_many, edit_files, normalize_val, read_file
 
 # change dir to tests directory to make relative paths possible
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -114,3 +114,202 @@ def test_cli_json():
     data = read_file(file, 'JSON')
 
     assert data['extra']['registered'] == 'true'
+
+
+def test_edit_file_many(tmpdir):
+    """Several edits are applied in a single read/write cycle."""
+    file = str(tmpdir.join('many.json'))
+    with open(file, 'w') as fd:
+        json.dump({'name': 'John', 'extra': {'gender': None}}, fd)
+
+    assert edit_file_many(file, 'JSON', [
+        ('name', 'Jack'),
+        ('extra.gender', 'male'),
+        ('users.0.enabled', True),
+    ]) is True
+
+    data = read_file(file, 'JSON')
+    assert data['name'] == 'Jack'
+    assert data['extra']['gender'] == 'male'
+    assert data['users'] == [{'enabled': True}]
+
+    # all values already match, so nothing is written
+    assert edit_file_many(file, 'JSON', [('name', 'Jack'), ('extra.gender', 'male')]) is False
+
+    # every value changed is counted, every match of a wildcard included
+    edit_file('users', [{'on': True}, {'on': False}, {'on': False}], file, 'JSON')
+    assert edit_file_count(file, 'JSON', [('users.*.on', True), ('name', 'John')]) == 3
+    assert edit_file_count(file, 'JSON', [('users.*.on', True)]) == 0
+
+
+def test_edit_file_many_must_exist(tmpdir):
+    """A missing key aborts the whole batch without writing anything."""
+    file = str(tmpdir.join('many.yaml'))
+    with open(file, 'w') as fd:
+        fd.write('name: John\n')
+
+    try:
+        edit_file_many(file, 'YAML', [('name', 'Jack'), ('age', 31)], must_exist=True)
+        assert False, 'ValueError expected'
+    except ValueError:
+        pass
+
+    assert read_file(file, 'YAML') == {'name': 'John'}
+
+
+def test_cli_batch(tmpdir):
+    file = str(tmpdir.join('batch.json'))
+    edits = str(tmpdir.join('edits.txt'))
+    with open(file, 'w') as fd:
+        json.dump({'name': 'John'}, fd)
+    with open(edits, 'w') as fd:
+        fd.write('# comment\n\nextra.gender=null\ncity=New York\n')
+
+    process = subprocess.Popen(
+        ['sde', '-k', 'name=Jack', '-k', 'age=31', '--edits-from', edits, file],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    process.communicate()
+
+    assert process.returncode == 0
+    assert read_file(file, 'JSON') == {
+        'name': 'Jack', 'age': 31, 'city': 'New York', 'extra': {'gender': None}
+    }
+
+    process = subprocess.Popen(
+        ['sde', '-m', '-k', 'name=Jack', file],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    out, _ = process.communicate()
+
+    assert process.returncode == 2
+    assert out == b''
+
+    # -v tells how many values changed, counting every match of a wildcard
+    edit_file('users', [{'on': True}, {'on': False}, {'on': False}], file, 'JSON')
+    out = subprocess.check_output(['sde', '-v', '-k', 'users.*.on=true', '-k', 'name=John', file])
+    assert out == b'changed (3)\n'
+    out = subprocess.check_output(['sde', '-v', 'name', 'John', file])
+    assert out == b'unchanged\n'
+
+
+def test_cli_intermixed_options(tmpdir):
+    file = str(tmpdir.join('mixed.json'))
+    with open(file, 'w') as fd:
+        json.dump({'name': 'John'}, fd)
+
+    subprocess.check_call(['sde', 'name', 'Jack', '-e', file])
+    assert read_file(file, 'JSON') == {'name': 'Jack'}
+
+    records = str(tmpdir.join('mixed.jsonl'))
+    with open(records, 'w') as fd:
+        fd.write('{"name": "a"}\n{"name": "b"}\n')
+    subprocess.check_call(['sde', 'n', '2', '--where', 'name=b', records])
+    with open(records) as fd:
+        assert fd.read() == '{"name": "a"}\n{"name": "b", "n": 2}\n'
+
+
+def test_edit_files(tmpdir):
+    for i in range(6):
+        with open(str(tmpdir.join('app{}.json'.format(i))), 'w') as fd:
+            json.dump({'image': {'tag': 'v1' if i else 'v2'}}, fd)
+    files = sorted(str(path) for path in tmpdir.listdir()) + [str(tmpdir.join('app.txt'))]
+    results = list(edit_files(files, [('image.tag', 'v2')], jobs=2))
+    assert [result[0] for result in results] == files
+    assert [result[1] for result in results] == [False] + [True] * 5 + [None]
+    assert results[-1][2] == 'Unknown extension: .txt'
+    for file in files[:-1]:
+        assert read_file(file, 'JSON') == {'image': {'tag': 'v2'}}
+
+
+def test_cli_many_files(tmpdir):
+    for name in ('a.json', 'b.yaml', 'c.json'):
+        edit_file('image.tag', 'v1', str(tmpdir.join(name)), 'JSON' if name.endswith('json') else 'YAML')
+    edit_file('image.tag', 'v2', str(tmpdir.join('c.json')), 'JSON')
+    pattern = str(tmpdir.join('*.json'))
+
+    process = subprocess.Popen(
+        ['sde', '-m', '-j', '2', 'image.tag', 'v2', pattern, str(tmpdir.join('b.yaml'))],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    out, _ = process.communicate()
+    # c.json already had the value
+    assert process.returncode == 2
+    assert out.decode().splitlines() == [
+        str(tmpdir.join('a.json')) + ': changed (1)',
+        str(tmpdir.join('c.json')) + ': unchanged',
+        str(tmpdir.join('b.yaml')) + ': changed (1)',
+    ]
+    assert read_file(str(tmpdir.join('b.yaml')), 'YAML') == {'image': {'tag': 'v2'}}
+
+    process = subprocess.Popen(
+        ['sde', '-e', '-k', 'image.digest=x', pattern],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    _, err = process.communicate()
+    assert process.returncode == 1
+    assert err.decode().count('is not present') == 2
+
+
+def test_cli_literal_filename(tmpdir):
+    # an existing name is not taken for a pattern, which would match vp.json
+    literal, other = str(tmpdir.join('v[p].json')), str(tmpdir.join('vp.json'))
+    for file in (literal, other):
+        with open(file, 'w') as fd:
+            json.dump({'a': 0}, fd)
+
+    subprocess.check_call(['sde', 'a', '1', literal])
+    assert read_file(literal, 'JSON') == {'a': 1}
+    assert read_file(other, 'JSON') == {'a': 0}
+
+
+def test_noop_edit_skips_parsing(tmpdir, monkeypatch):
+    import sde.sde
+    file = str(tmpdir.join('noop.json'))
+    with open(file, 'w') as fp:
+        json.dump({'name': 'Jack', 'items': list(range(100))}, fp)
+    os.utime(file, (1000000000, 1000000000))
+
+    def fail(*args):
+        raise AssertionError('the document was parsed')
+
+    monkeypatch.setattr(sde.sde, 'json_load', fail)
+    assert edit_file('name', 'Jack', file, 'JSON') is False
+    assert os.stat(file).st_mtime == 1000000000
+
+
+def test_unchanged_output_keeps_file(tmpdir):
+    for name, fmt in (('same.json', 'JSON'), ('same.yaml', 'YAML')):
+        file = str(tmpdir.join(name))
+        assert edit_file('age', 30, file, fmt) is True
+        os.utime(file, (1000000000, 1000000000))
+        inode = os.stat(file).st_ino
+        # the value changes, then changes back: the output is the same
+        assert edit_file_many(file, fmt, [('age', 31), ('age', 30)]) is False
+        assert os.stat(file).st_mtime == 1000000000
+        assert os.stat(file).st_ino == inode
+        assert not [path for path in tmpdir.listdir() if path.basename.endswith('.tmp')]
+
+
+def test_replace_file_temporary(tmpdir):
+    file = str(tmpdir.join('temp.json'))
+    # a temporary file left over by an interrupted edit is in no one's way
+    with open(file + '.tmp', 'w') as fd:
+        fd.write('partial')
+    assert edit_file('age', 30, file, 'JSON') is True
+    assert edit_file('age', 31, file, 'JSON', stream=True) is True
+    assert read_file(file, 'JSON') == {'age': 31}
+    assert sorted(path.basename for path in tmpdir.listdir()) == ['temp.json', 'temp.json.tmp']
+
+    # edited files get the permissions of new files, not the private ones
+    # of temporary files
+    umask = os.umask(0o22)
+    try:
+        assert edit_file('age', 32, file, 'JSON') is True
+    finally:
+        os.umask(umask)
+    assert os.stat(file).st_mode & 0o777 == 0o644
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+from sde import edit_file, query_file
+from sde.sdg import INDEX_SUFFIX, PathIndex
+
+DOCUMENT = {
+    'name': 'John',
+    'list': [1, {'x': list(range(12))}, [], {}],
+    'nested': {'null': None, 'float': 1.5, 'empty': {}},
+}
+KEYS = ['name', 'list', 'list.1.x.10', 'nested', 'nested.null', 'list.3']
+
+
+@pytest.mark.parametrize('fmt, name', [('JSON', 'data.json'), ('YAML', 'data.yaml')])
+def test_query_file(tmpdir, fmt, name):
+    file = str(tmpdir.join(name))
+    edit_file('name', 'John', file, fmt)
+    for key, value in DOCUMENT.items():
+        edit_file(key, value, file, fmt)
+    expected = [DOCUMENT['name'], DOCUMENT['list'], 10, DOCUMENT['nested'], None, {}]
+
+    assert query_file(file, fmt, KEYS) == expected
+    assert not os.path.exists(file + INDEX_SUFFIX)
+    # builds the index, then reads from it
+    assert query_file(file, fmt, KEYS, index=True) == expected
+    with PathIndex.open(file) as index:
+        assert [index.get(key) for key in KEYS] == expected
+    assert query_file(file, fmt, KEYS, index=True) == expected
+
+    with pytest.raises(KeyError):
+        query_file(file, fmt, ['list.4'], index=True)
+    # the index is not used once the file changed
+    edit_file('name', 'Jack', file, fmt)
+    assert PathIndex.open(file) is None
+    assert query_file(file, fmt, ['name'], index=True) == ['Jack']
+    assert PathIndex.open(file) is not None
+
+
+def test_cli(tmpdir):
+    file = str(tmpdir.join('cli.json'))
+    with open(file, 'w') as fd:
+        json.dump(DOCUMENT, fd)
+
+    output = subprocess.check_output(['sdg', '-i', 'name', 'list.1', 'nested.float', file])
+    assert output.decode().splitlines() == ['John', json.dumps(DOCUMENT['list'][1]), '1.5']
+
+    process = subprocess.Popen(['sdg', 'name', 'missing', file],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    assert process.returncode == 1
+    assert out == b''
+    assert b'missing is not present' in err
+
+
+def test_yaml_only_values(tmpdir):
+    file = str(tmpdir.join('types.yaml'))
+    with open(file, 'w') as fd:
+        fd.write('name: x\nday: 2001-01-01\nnested: {day: 2001-01-01}\n')
+    keys = ['name', 'day', 'nested']
+    plain = subprocess.check_output(['sdg'] + keys + [file])
+    assert plain.decode().splitlines() == ['x', '2001-01-01', '{"day": "2001-01-01"}']
+    # the same output when building the index, and when reading from it
+    for _ in range(2):
+        assert subprocess.check_output(['sdg', '-i'] + keys + [file]) == plain
+    assert PathIndex.open(file) is not None
+
+    # keys that are not strings can't be indexed
+    file = str(tmpdir.join('ports.yaml'))
+    with open(file, 'w') as fd:
+        fd.write('name: x\nports: {80: http}\n')
+    assert query_file(file, 'YAML', ['name'], index=True) == ['x']
+    assert PathIndex.open(file) is None
+    assert sorted(os.listdir(str(tmpdir))) == ['ports.yaml', 'types.yaml', 'types.yaml' + INDEX_SUFFIX]
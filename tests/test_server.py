@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import time
+
+from sde import read_file
+from sde.server import request, run
+
+
+def test_run(tmpdir):
+    file = str(tmpdir.join('run.json'))
+    response = run(['name', 'Jack', 'run.json'], cwd=str(tmpdir))
+    assert response == {'status': 0, 'stdout': '', 'stderr': ''}
+    assert read_file(file, 'JSON') == {'name': 'Jack'}
+
+    assert run(['-m', 'name', 'Jack', file])['status'] == 2
+    response = run(['--edits-from', '-', file], stdin='age=31\n')
+    assert response['status'] == 0
+    assert read_file(file, 'JSON') == {'name': 'Jack', 'age': 31}
+
+    response = run(['-e', 'missing', 'x', file])
+    assert response['status'] == 1
+    assert 'missing is not present' in response['stderr']
+
+
+def test_server(tmpdir):
+    address = str(tmpdir.join('sde.sock'))
+    file = str(tmpdir.join('served.yaml'))
+    assert request(address, ['name', 'Jack', file]) is None
+
+    server = subprocess.Popen(['sde', '--server', address], stderr=subprocess.PIPE)
+    try:
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.05)
+        env = dict(os.environ, SDE_SOCKET=address)
+        for i in range(3):
+            status = subprocess.call(['sde', 'key{}'.format(i), str(i), file], env=env)
+            assert status == 0
+        assert subprocess.call(['sde', '-m', 'key0', '0', file], env=env) == 2
+        assert read_file(file, 'YAML') == {'key0': 0, 'key1': 1, 'key2': 2}
+
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'sde', '-k', 'name=Jack', os.path.basename(file)],
+            cwd=str(tmpdir), env=env, stderr=subprocess.PIPE
+        )
+        process.communicate()
+        assert process.returncode == 0
+        assert read_file(file, 'YAML')['name'] == 'Jack'
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from sde.collection import DottedDict
+from sde.snapshot import Snapshot, SnapshotDict
+
+
+def test_updates_copy_only_the_edited_path():
+    config = SnapshotDict({'a': {'b': {'c': 1}, 'd': {'e': 2}}, 'list': [{'x': 1}, {'y': 2}]})
+    before = config.snapshot()
+
+    config['a.b.c'] = 10
+    config.update([('list.1.y', 20), ('new.0.key', 'val')])
+    after = config.snapshot()
+
+    assert after['a.b.c'] == 10
+    assert after['list.1.y'] == 20
+    assert after['new'].to_python() == [{'key': 'val'}]
+    assert config.version == 2
+    # the old version is untouched
+    assert before['a.b.c'] == 1
+    assert before['list.1.y'] == 2
+    assert 'new' not in before
+    # untouched subtrees are shared between versions
+    assert after.store['a']['d'] is before.store['a']['d']
+    assert after.store['list'][0] is before.store['list'][0]
+    assert after.store['a'] is not before.store['a']
+
+
+def test_failed_update_publishes_nothing():
+    config = SnapshotDict({'a': {'b': 1}, 'list': [1]})
+    with pytest.raises(KeyError):
+        config.update([('a.b', 2), ('a.b.c', 3)])
+    with pytest.raises(IndexError):
+        del config['list.5']
+    assert config.version == 0
+    assert config.to_python() == {'a': {'b': 1}, 'list': [1]}
+
+
+def test_values_are_copied_and_validated():
+    value = {'nested': [1, 2]}
+    config = SnapshotDict(DottedDict({'a': 1}))
+    config['b'] = value
+    value['nested'].append(3)
+    assert config['b.nested'] == [1, 2]
+    assert isinstance(config['b'], Snapshot)
+    with pytest.raises(ValueError):
+        config['c'] = {'dotted.key': 1}
+
+    del config['a']
+    assert config.get('a') is None
+    assert list(config) == ['b']
+    assert config['b.nested.1'] == 2 == config['b']['nested'][1]
+
+
+def test_readers_see_whole_updates():
+    config = SnapshotDict({'left': 0, 'right': 0})
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            snapshot = config.snapshot()
+            if snapshot['left'] != snapshot['right']:
+                errors.append(snapshot.to_python())
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+
+    def write():
+        for i in range(500):
+            config.update([('left', i), ('right', i)])
+
+    writers = [threading.Thread(target=write) for _ in range(2)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    done.set()
+    for reader in readers:
+        reader.join()
+
+    assert not errors
+    assert config.version == 1000
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+# modules a JSON edit must not import
+HEAVY = ('yaml', 'argparse', 'concurrent.futures', 'multiprocessing', 'socket',
+         'sde.jsonstream', 'sde.yamlstream', 'sde.server')
+
+# generous budget, in microseconds, for importing sde.sde (about 15ms here)
+IMPORT_BUDGET = int(os.environ.get('SDE_IMPORT_BUDGET', 100000))
+
+
+def _python(code):
+    return subprocess.check_output([sys.executable, '-X', 'importtime', '-c', code],
+                                   stderr=subprocess.STDOUT).decode()
+
+
+def test_json_edit_imports(tmpdir):
+    file = str(tmpdir.join('startup.json'))
+    output = _python(
+        'import sys\n'
+        'from sde import edit_file\n'
+        'edit_file("name", "Jack", {!r}, "JSON")\n'
+        'print(" ".join(sorted(sys.modules)))\n'.format(file)
+    )
+    modules = output.splitlines()[-1].split()
+    assert [name for name in HEAVY if name in modules] == []
+
+
+def test_import_budget():
+    lines = [line for line in _python('import sde.sde').splitlines() if line.startswith('import time:')]
+    cumulative = {}
+    for line in lines[1:]:
+        _, total, name = line.split('|')
+        cumulative[name.strip()] = int(total)
+    assert cumulative['sde.sde'] < IMPORT_BUDGET
@@ -0,0 +1,278 @@
+import io
+import json
+import subprocess
+
+import pytest
+import yaml
+
+from sde import edit_file, edit_file_many, edit_stream, read_file
+from sde import jsonstream, yamlstream
+from sde.streaming import PipeSource, Unsupported
+
+DOCUMENT = b'''{"name":"John",  "age" : 31,
+  "tags": [ "a", "b\\"]" ],
+  "extra": {"gender": null, "nested": {"deep": [1, {"x": 1.5e3}]}}
+}
+'''
+
+
+def _write(tmpdir, name, content):
+    file = str(tmpdir.join(name))
+    with open(file, 'wb') as fd:
+        fd.write(content)
+    return file
+
+
+def _read(file):
+    with open(file, 'rb') as fd:
+        return fd.read()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, jsonstream.CHUNK_SIZE])
+def test_locate(chunk_size):
+    def value(key):
+        fp = io.BytesIO(DOCUMENT)
+        span = jsonstream.locate(fp, key, chunk_size=chunk_size)
+        assert not span.missing
+        return json.loads(span.read(fp).decode('utf-8'))
+
+    assert value('name') == 'John'
+    assert value('age') == 31
+    assert value('tags.1') == 'b"]'
+    assert value('extra.nested.deep.1.x') == 1500.0
+    assert value('extra') == json.loads(DOCUMENT.decode('utf-8'))['extra']
+
+
+def test_stream_edit_keeps_formatting(tmpdir):
+    file = _write(tmpdir, 'data.json', DOCUMENT)
+
+    assert edit_file('extra.nested.deep.1.x', 'y', file, 'JSON', stream=True) is True
+    assert edit_file('age', 32, file, 'JSON', stream=True) is True
+    assert _read(file) == DOCUMENT.replace(b'1.5e3', b'"y"').replace(b'31', b'32')
+
+    # matching value, nothing to write
+    assert edit_file('age', 32, file, 'JSON', stream=True) is False
+
+
+def test_stream_edit_inserts(tmpdir):
+    original = {'name': 'John', 'list': [1], 'empty': {}}
+    file = _write(tmpdir, 'data.json', json.dumps(original, indent=4).encode('utf-8'))
+
+    assert edit_file_many(file, 'JSON', [
+        ('city', 'New York'),
+        ('list.1', 2),
+        ('empty.key', True),
+        ('new.0.deep', None),
+    ], stream=True) is True
+
+    expected = dict(original, city='New York', list=[1, 2], empty={'key': True}, new=[{'deep': None}])
+    assert json.loads(_read(file).decode('utf-8')) == expected
+    # new members and elements line up with the existing ones
+    assert _read(file) == b'''{
+    "name": "John",
+    "list": [
+        1,
+        2
+    ],
+    "empty": {"key": true},
+    "city": "New York",
+    "new": [
+        {
+            "deep": null
+        }
+    ]
+}'''
+
+    # single-line containers get a space after the comma
+    file = _write(tmpdir, 'line.json', b'{"t": "b", "list": [1, 2]}')
+    assert edit_file_many(file, 'JSON', [('list.2', 3), ('status', 'done')], stream=True) is True
+    assert _read(file) == b'{"t": "b", "list": [1, 2, 3], "status": "done"}'
+    file = _write(tmpdir, 'compact.json', b'{"a":[1]}')
+    assert edit_file_many(file, 'JSON', [('a.1', 2), ('b', 1)], stream=True) is True
+    assert _read(file) == b'{"a":[1, 2], "b": 1}'
+    file = _write(tmpdir, 'compact.json', b'{"a":[1,2],"b":1}')
+    assert edit_file_many(file, 'JSON', [('a.2', 3), ('c', 2)], stream=True) is True
+    assert _read(file) == b'{"a":[1,2,3],"b":1,"c": 2}'
+
+
+def test_stream_edit_errors(tmpdir):
+    file = _write(tmpdir, 'data.json', DOCUMENT)
+
+    with pytest.raises(ValueError):
+        edit_file('missing', 1, file, 'JSON', must_exist=True, stream=True)
+    with pytest.raises(IndexError):
+        edit_file('tags.5', 1, file, 'JSON', stream=True)
+    with pytest.raises(KeyError):
+        edit_file('name.first', 1, file, 'JSON', stream=True)
+    assert _read(file) == DOCUMENT
+
+
+YAML_DOCUMENT = u'''# deployment settings
+image:
+  name: app  # the image name
+  tag: "1.0"
+replicas: 2
+ports:
+- 80
+- 443
+flow: {a: 1, b: [x, y]}
+notes: |
+  free text
+'''
+
+
+def test_stream_yaml_edit_keeps_comments(tmpdir):
+    file = _write(tmpdir, 'data.yaml', YAML_DOCUMENT.encode('utf-8'))
+
+    assert edit_file_many(file, 'YAML', [
+        ('image.tag', '2.0'),
+        ('replicas', 3),
+        ('ports.1', 8443),
+        ('flow.b.0', 'a, b'),
+    ], stream=True) is True
+    assert edit_file('replicas', 3, file, 'YAML', stream=True) is False
+
+    assert _read(file).decode('utf-8') == YAML_DOCUMENT \
+        .replace('"1.0"', "'2.0'") \
+        .replace('replicas: 2', 'replicas: 3') \
+        .replace('443', '8443') \
+        .replace('[x, y]', "['a, b', y]")
+
+
+def test_stream_yaml_edit_inserts(tmpdir):
+    file = _write(tmpdir, 'data.yaml', YAML_DOCUMENT.encode('utf-8'))
+
+    assert edit_file_many(file, 'YAML', [
+        ('image.pull', 'always'),
+        ('ports.2', 8080),
+        ('flow.c', True),
+    ], stream=True) is True
+
+    assert _read(file).decode('utf-8') == (u'''# deployment settings
+image:
+  name: app  # the image name
+  tag: "1.0"
+  pull: always
+replicas: 2
+ports:
+- 80
+- 443
+- 8080
+flow: {a: 1, b: [x, y], c: true}
+notes: |
+  free text
+''')
+
+    # a new key after a block scalar needs the whole document to be dumped again
+    assert edit_file('extra.list.0', None, file, 'YAML', stream=True) is True
+    assert read_file(file, 'YAML')['extra'] == {'list': [None]}
+
+
+def test_stream_yaml_fallback(tmpdir):
+    file = _write(tmpdir, 'data.yaml', b'base: &base\n  a: 1\ncopy: *base\nblock: |\n  text\n')
+
+    assert edit_file('copy.a', 2, file, 'YAML', stream=True) is True
+    assert edit_file('block', 'line', file, 'YAML', stream=True) is True
+    data = read_file(file, 'YAML')
+    assert data['copy'] == {'a': 2}
+    assert data['block'] == 'line'
+
+    with pytest.raises(ValueError):
+        edit_file('missing', 1, file, 'YAML', must_exist=True, stream=True)
+
+
+def test_stream_yaml_unsupported(tmpdir):
+    def locate(document, key):
+        return yamlstream.locate(io.StringIO(document), key)
+
+    # explicit keys are further right than the indent of new ones
+    with pytest.raises(Unsupported):
+        locate(u'a:\n  ? b\n  : 1\n', 'a.c')
+    assert locate(u'a: &x\n  b: 1\n', 'a.c').prefix == u'\n  c: '
+    # safe_load keeps the last of duplicate keys, and loads a single document
+    with pytest.raises(Unsupported):
+        locate(u'a: {b: 1}\nc: 2\na: {b: 3}\n', 'a.b')
+    with pytest.raises(Unsupported):
+        locate(u'a: 1\n---\na: 2\n', 'a')
+    with pytest.raises(yaml.YAMLError):
+        locate(u'a: 1\nb: [\n', 'a')
+
+    file = _write(tmpdir, 'dup.yaml', b'a: 1\nb: 2\na: 3\n')
+    assert edit_file('a', 1, file, 'YAML') is True
+    assert read_file(file, 'YAML') == {'a': 1, 'b': 2}
+    file = _write(tmpdir, 'explicit.yaml', b'a:\n  ? b\n  : 1\n')
+    assert edit_file('a.c', 2, file, 'YAML', stream=True) is True
+    assert read_file(file, 'YAML') == {'a': {'b': 1, 'c': 2}}
+
+
+def test_pipe_source():
+    source = PipeSource(io.BytesIO(b'0123456789'), chunk_size=3)
+    assert source.read(4) == b'0123'
+    source.seek(1)
+    assert source.read(2) == b'12'
+    source.seek(0)
+    source.forward()
+    assert source.read(2) == b'01'
+    source.seek(5)
+    assert source.read() == b'56789'
+    assert source.size <= 3
+    with pytest.raises(io.UnsupportedOperation):
+        source.seek(0)
+
+
+def _pipe(src, edits):
+    dst = io.BytesIO()
+    result = edit_stream(io.BufferedReader(io.BytesIO(src)), dst, edits)
+    return result, dst.getvalue()
+
+
+def test_edit_stream():
+    assert _pipe(DOCUMENT, [('age', 32)]) == (True, DOCUMENT.replace(b'31', b'32'))
+    assert _pipe(DOCUMENT, [('age', 31)]) == (False, DOCUMENT)
+    result, output = _pipe(DOCUMENT, [('age', 32), ('name', 'Jack')])
+    assert result is True
+    assert json.loads(output.decode('utf-8'))['name'] == 'Jack'
+
+    yaml_document = b'# comment\nname: John\nlist: [1, 2]\n'
+    assert _pipe(yaml_document, [('name', 'Jack')]) == (True, yaml_document.replace(b'John', b'Jack'))
+    assert _pipe(yaml_document, [('list.2', 3)]) == (True, yaml_document.replace(b'2]', b'2, 3]'))
+    # aliases can't be edited in place, the whole document is loaded instead
+    result, output = _pipe(b'a: &x 1\nb: *x\n', [('b', 2)])
+    assert output == b'a: 1\nb: 2\n'
+    # flow style YAML is sniffed as JSON, and edited as YAML once it fails to parse
+    assert _pipe(b'{a: 1}  # comment\n', [('a', 2)]) == (True, b'{a: 2}  # comment\n')
+    assert _pipe(b'[a, b]\n', [('1', 'x'), ('2', 'y')]) == (True, b'- a\n- x\n- y\n')
+    with pytest.raises(ValueError):
+        edit_stream(io.BufferedReader(io.BytesIO(DOCUMENT)), io.BytesIO(), [('missing', 1)],
+                    must_exist=True)
+    # empty input is an empty document
+    assert _pipe(b'', [('a', 1)]) == (True, b'a: 1\n')
+    assert _pipe(b'', [('a', 1), ('b', 2)]) == (True, b'a: 1\nb: 2\n')
+    # truncated JSON fails with the error of the JSON parser
+    for edits in ([('a', 1)], [('a', 1), ('b', 2)]):
+        with pytest.raises(ValueError) as error:
+            _pipe(b'{"a": ', edits)
+        assert not isinstance(error.value, yaml.YAMLError)
+    with pytest.raises(ValueError):
+        _pipe(b'a: [\n', [('a', 1), ('b', 2)])
+
+
+def test_cli_pipe():
+    process = subprocess.Popen(['sde', '-m', 'name', 'Jack', '-'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = process.communicate(DOCUMENT)
+    assert process.returncode == 0
+    assert out == DOCUMENT.replace(b'John', b'Jack')
+
+    process = subprocess.Popen(['sde', '-m', 'name', 'John', '-'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = process.communicate(DOCUMENT)
+    assert process.returncode == 2
+    assert out == DOCUMENT
+
+    process = subprocess.Popen(['sde', 'name', 'Jack', '-'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate(b'{"name": ')
+    assert process.returncode == 1
+    assert out == b''
+    assert b'Traceback' not in err
@@ -0,0 +1,49 @@
+import json
+import subprocess
+
+from sde import disable_timings, edit_file, enable_timings
+from sde.timing import Timings, phase
+
+
+def test_nested_phases():
+    timings = Timings(memory=False)
+    with timings.phase('outer'):
+        for _ in range(2):
+            with timings.phase('inner'):
+                pass
+    timings.stop()
+    phases = timings.to_dict()['phases']
+    assert [(p['name'], p['calls'], p['peak_bytes']) for p in phases] == \
+        [('inner', 2, None), ('outer', 1, None)]
+    # nested time is not counted twice
+    assert sum(p['seconds'] for p in phases) <= timings.to_dict()['total_seconds']
+
+
+def test_edit_timings(tmpdir):
+    file = str(tmpdir.join('timed.json'))
+    edit_file('a', 1, file, 'JSON')
+    timings = enable_timings()
+    try:
+        edit_file('a', 2, file, 'JSON', fsync=True)
+    finally:
+        assert disable_timings() is timings
+    names = [p['name'] for p in timings.to_dict()['phases']]
+    for name in ('read', 'wrap', 'edit', 'serialize', 'write', 'fsync', 'rename'):
+        assert name in names
+    assert all(p['peak_bytes'] > 0 for p in timings.to_dict()['phases'])
+    assert 'rename' in timings.format()
+    # nothing is recorded once disabled
+    with phase('ignored'):
+        pass
+    assert 'ignored' not in timings.phases
+
+
+def test_cli_timings(tmpdir):
+    file = str(tmpdir.join('cli.yaml'))
+    profile = str(tmpdir.join('sde.prof'))
+    process = subprocess.Popen(['sde', '--timings', '--timings-format', 'json', '--profile', profile,
+                                'a', '1', file], stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    assert process.returncode == 0
+    assert 'serialize' in [p['name'] for p in json.loads(stderr.decode())['phases']]
+    assert tmpdir.join('sde.prof').size() > 0